@@ -8,17 +8,124 @@ This script shows how to:
 3. Make API calls to the server
 """
 
+import argparse
 import asyncio
-import requests
+import hashlib
+import httpx
+import shelve
+import socket
 import time
-import json
-from typing import Dict, Any
+import orjson
+from collections import defaultdict, deque
+from statistics import quantiles
+from time import perf_counter_ns
+from typing import Awaitable, Dict, Any, List, TypeVar
 
 # Import LLM components
-from llm.models.transformer_model import TransformerModel
 from llm.models.text_classifier import TextClassifier
 from llm.models.text_generator import TextGenerator
 
+# Server configuration
+BASE_URL = "http://localhost:8000"
+API_BASE = "/api/v1"
+
+# Endpoint paths, resolved against BASE_URL by the client
+HEALTH_PATH = "/health"
+GENERATE_PATH = f"{API_BASE}/inference/generate"
+GENERATE_STREAM_PATH = f"{API_BASE}/inference/generate_stream"
+BATCH_PATH = f"{API_BASE}/inference/batch"
+MODELS_PATH = f"{API_BASE}/inference/models"
+STATS_PATH = f"{API_BASE}/inference/stats"
+
+# Connection pool limits and timeouts for the shared API client. HTTP/2 is
+# negotiated via ALPN, so it only takes effect when BASE_URL is https (e.g.
+# behind a TLS proxy); plain http falls back to pooled HTTP/1.1 connections.
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+CLIENT_TIMEOUT = httpx.Timeout(30.0, connect=3.0)
+
+# Retry budget for transient failures: connection errors are retried by the
+# transport itself, overloaded/unavailable responses with exponential backoff
+CONNECT_RETRIES = 3
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.2
+
+# Responses are small JSON bodies or streamed tokens, so skip compression and
+# send packets immediately instead of waiting on Nagle's algorithm
+CLIENT_HEADERS = {"Accept-Encoding": "identity"}
+SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+
+# On-disk cache of successful inference responses, keyed by request body
+CACHE_PATH = "llm_demo_cache"
+CACHE_TTL_SECONDS = 3600
+
+# Request bodies are encoded with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Most recent client-side round-trip times per endpoint, in nanoseconds
+LATENCIES = defaultdict(lambda: deque(maxlen=128))
+
+T = TypeVar("T")
+
+class RetryTransport(httpx.AsyncHTTPTransport):
+    """Async transport that retries transient error responses with backoff."""
+    
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(MAX_RETRIES + 1):
+            response = await super().handle_async_request(request)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            
+            # Honour the server's Retry-After hint when it gives one in seconds
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = BACKOFF_FACTOR * (2 ** attempt)
+            
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+def create_client() -> httpx.AsyncClient:
+    """Create the pooled async client used for all API calls."""
+    transport = RetryTransport(
+        http2=True,
+        retries=CONNECT_RETRIES,
+        limits=CLIENT_LIMITS,
+        socket_options=SOCKET_OPTIONS
+    )
+    return httpx.AsyncClient(
+        base_url=BASE_URL,
+        transport=transport,
+        timeout=CLIENT_TIMEOUT,
+        headers=CLIENT_HEADERS
+    )
+
+async def _timed(path: str, awaitable: Awaitable[T]) -> T:
+    """Await an API call and record its round-trip time for the given endpoint."""
+    start = perf_counter_ns()
+    try:
+        return await awaitable
+    finally:
+        LATENCIES[path].append(perf_counter_ns() - start)
+
+def print_latency_summary():
+    """Print client-side p50/p95 latency for every endpoint that was called."""
+    if not LATENCIES:
+        return
+    
+    print("\nClient-side latency:")
+    for path, samples in LATENCIES.items():
+        if len(samples) > 1:
+            cut_points = quantiles(samples, n=20)
+            p50, p95 = cut_points[9], cut_points[18]
+        else:
+            p50 = p95 = samples[0]
+        print(f"  {path}: p50={p50 / 1e6:.1f}ms p95={p95 / 1e6:.1f}ms (n={len(samples)})")
+
 def demo_llm_usage():
     """Demonstrate direct LLM usage."""
     print("=" * 50)
@@ -61,8 +168,8 @@ def demo_llm_usage():
         ]
         
         print("\nClassifying texts:")
-        for text in texts:
-            result = classifier.classify(text)
+        results = classifier.classify_batch(texts)
+        for text, result in zip(texts, results):
             print(f"Text: {text}")
             print(f"Classification: {result}")
             print()
@@ -78,64 +185,166 @@ def demo_llm_usage():
     except Exception as e:
         print(f"Error in LLM demo: {str(e)}")
 
-def demo_mcp_server_api():
-    """Demonstrate MCP Server API usage."""
+def _cache_key(path: str, data: Dict[str, Any]) -> str:
+    """Build a content-addressed cache key for a JSON request."""
+    body = orjson.dumps({"path": path, "data": data}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(body).hexdigest()
+
+async def _cached_post(
+    client: httpx.AsyncClient,
+    path: str,
+    data: Dict[str, Any],
+    use_cache: bool = True
+) -> httpx.Response:
+    """POST JSON to the API, serving repeated requests from the response cache."""
+    if not use_cache:
+        return await _timed(path, client.post(path, content=orjson.dumps(data), headers=JSON_HEADERS))
+    
+    key = _cache_key(path, data)
+    with shelve.open(CACHE_PATH) as cache:
+        entry = cache.get(key)
+    
+    if entry is not None and time.time() - entry[0] < CACHE_TTL_SECONDS:
+        return httpx.Response(
+            200,
+            content=entry[1],
+            headers=JSON_HEADERS
+        )
+    
+    response = await _timed(path, client.post(path, content=orjson.dumps(data), headers=JSON_HEADERS))
+    if response.status_code == 200:
+        with shelve.open(CACHE_PATH) as cache:
+            cache[key] = (time.time(), response.content)
+    
+    return response
+
+async def agenerate(
+    client: httpx.AsyncClient,
+    prompt: str,
+    use_cache: bool = True,
+    **kwargs
+) -> httpx.Response:
+    """Request text generation from the API."""
+    data = {"prompt": prompt, **kwargs}
+    return await _cached_post(client, GENERATE_PATH, data, use_cache)
+
+async def agenerate_stream(client: httpx.AsyncClient, prompt: str, **kwargs) -> str:
+    """Stream text generation from the API, printing tokens as they arrive."""
+    data = {"prompt": prompt, **kwargs}
+    headers = {**JSON_HEADERS, "Accept": "text/event-stream"}
+    tokens = []
+    start = perf_counter_ns()
+    
+    async with client.stream(
+        "POST",
+        GENERATE_STREAM_PATH,
+        content=orjson.dumps(data),
+        headers=headers
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            payload = line[len("data: "):]
+            if payload == "[DONE]":
+                break
+            token = orjson.loads(payload).get("token", "")
+            tokens.append(token)
+            print(token, end="", flush=True)
+    
+    LATENCIES[GENERATE_STREAM_PATH].append(perf_counter_ns() - start)
+    print()
+    return "".join(tokens)
+
+async def aclassify_batch(
+    client: httpx.AsyncClient,
+    texts: List[str],
+    use_cache: bool = True
+) -> httpx.Response:
+    """Request classification of several texts in a single API call."""
+    data = {"texts": texts, "task_type": "classification"}
+    return await _cached_post(client, BATCH_PATH, data, use_cache)
+
+async def demo_mcp_server_api(use_cache: bool = True):
+    """
+    Demonstrate MCP Server API usage.
+    
+    Args:
+        use_cache: Whether to serve repeated inference requests from the local cache
+    """
     print("\n" + "=" * 50)
     print("MCP Server API Demo")
     print("=" * 50)
     
-    # Server configuration
-    base_url = "http://localhost:8000"
-    api_base = f"{base_url}/api/v1"
-    
     try:
-        # Check server health
-        print("Checking server health...")
-        health_response = requests.get(f"{base_url}/health")
-        if health_response.status_code == 200:
-            health_data = health_response.json()
-            print(f"Server status: {health_data['status']}")
-            print(f"Uptime: {health_data['uptime']:.2f} seconds")
-        else:
-            print(f"Server health check failed: {health_response.status_code}")
-            return
+        async with create_client() as client:
+            # Preflight: check health and list models in one round-trip
+            print("Checking server health...")
+            health_response, models_response = await asyncio.gather(
+                _timed(HEALTH_PATH, client.get(HEALTH_PATH)),
+                _timed(MODELS_PATH, client.get(MODELS_PATH))
+            )
+            if health_response.status_code == 200:
+                health_data = orjson.loads(health_response.content)
+                print(f"Server status: {health_data['status']}")
+                print(f"Uptime: {health_data['uptime']:.2f} seconds")
+            else:
+                print(f"Server health check failed: {health_response.status_code}")
+                return
+            
+            # The remaining calls are independent, so issue them concurrently
+            gen_response, class_response, stats_response = await asyncio.gather(
+                agenerate(
+                    client,
+                    "The future of artificial intelligence is",
+                    use_cache=use_cache,
+                    max_length=100,
+                    temperature=0.8
+                ),
+                aclassify_batch(
+                    client,
+                    [
+                        "I love this movie! It's amazing!",
+                        "This is the worst film I've ever seen.",
+                        "The weather is nice today."
+                    ],
+                    use_cache=use_cache
+                ),
+                _timed(STATS_PATH, client.get(STATS_PATH))
+            )
+            
+            # Long generations are streamed so output starts with the first token
+            print("\nStreaming a story via API...")
+            await agenerate_stream(
+                client,
+                "Title: The AI Adventure\nGenre: science fiction\n\nOnce upon a time,",
+                max_length=200,
+                temperature=0.8
+            )
         
         # Text generation via API
         print("\nGenerating text via API...")
-        gen_data = {
-            "prompt": "The future of artificial intelligence is",
-            "max_length": 100,
-            "temperature": 0.8
-        }
-        
-        gen_response = requests.post(f"{api_base}/inference/generate", json=gen_data)
         if gen_response.status_code == 200:
-            gen_result = gen_response.json()
+            gen_result = orjson.loads(gen_response.content)
             print(f"Generated text: {gen_result['result']}")
             print(f"Processing time: {gen_result['processing_time_ms']}ms")
         else:
             print(f"Text generation failed: {gen_response.status_code}")
         
         # Text classification via API
-        print("\nClassifying text via API...")
-        class_data = {
-            "text": "I love this movie! It's amazing!",
-            "return_probabilities": True
-        }
-        
-        class_response = requests.post(f"{api_base}/inference/classify", json=class_data)
+        print("\nClassifying texts via batch API...")
         if class_response.status_code == 200:
-            class_result = class_response.json()
-            print(f"Classification result: {class_result['result']}")
+            class_result = orjson.loads(class_response.content)
+            for result in class_result['results']:
+                print(f"Classification result: {result}")
             print(f"Processing time: {class_result['processing_time_ms']}ms")
         else:
             print(f"Text classification failed: {class_response.status_code}")
         
         # Get available models
         print("\nGetting available models...")
-        models_response = requests.get(f"{api_base}/inference/models")
         if models_response.status_code == 200:
-            models_data = models_response.json()
+            models_data = orjson.loads(models_response.content)
             print(f"Available models: {models_data['total']}")
             for model in models_data['models']:
                 print(f"  - {model['model_id']} ({model['task_type']})")
@@ -144,14 +353,13 @@ def demo_mcp_server_api():
         
         # Get inference statistics
         print("\nGetting inference statistics...")
-        stats_response = requests.get(f"{api_base}/inference/stats")
         if stats_response.status_code == 200:
-            stats_data = stats_response.json()
+            stats_data = orjson.loads(stats_response.content)
             print(f"Statistics: {stats_data}")
         else:
             print(f"Failed to get statistics: {stats_response.status_code}")
         
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("Could not connect to MCP Server. Make sure it's running on localhost:8000")
     except Exception as e:
         print(f"Error in MCP Server API demo: {str(e)}")
@@ -176,6 +384,14 @@ async def demo_async_inference():
 
 def main():
     """Main function to run all demos."""
+    parser = argparse.ArgumentParser(description="LLM and MCP Server Demo")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API instead of reusing cached inference responses"
+    )
+    args = parser.parse_args()
+    
     print("LLM and MCP Server Demo")
     print("This script demonstrates the capabilities of both the LLM package and MCP Server")
     print()
@@ -184,11 +400,13 @@ def main():
     demo_llm_usage()
     
     # Demo 2: MCP Server API usage
-    demo_mcp_server_api()
+    asyncio.run(demo_mcp_server_api(use_cache=not args.no_cache))
     
     # Demo 3: Async inference
     asyncio.run(demo_async_inference())
     
+    print_latency_summary()
+    
     print("\n" + "=" * 50)
     print("Demo Complete!")
     print("=" * 50)
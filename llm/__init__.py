@@ -5,15 +5,32 @@ A comprehensive package for natural language processing and machine learning
 using transformer-based models.
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "LLM Development Team"
 
-from .models.transformer_model import TransformerModel
-from .models.text_classifier import TextClassifier
-from .models.text_generator import TextGenerator
+# Model classes are imported on first access so that `import llm` does not
+# pull in torch/transformers
+_LAZY_IMPORTS = {
+    "TransformerModel": ".models.transformer_model",
+    "TextClassifier": ".models.text_classifier",
+    "TextGenerator": ".models.text_generator"
+}
 
 __all__ = [
     "TransformerModel",
     "TextClassifier", 
     "TextGenerator"
-]
\ No newline at end of file
+]
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
@@ -4,12 +4,29 @@ LLM Models Package
 Contains various model implementations for natural language processing tasks.
 """
 
-from .transformer_model import TransformerModel
-from .text_classifier import TextClassifier
-from .text_generator import TextGenerator
+import importlib
+
+# Model classes are imported on first access so that importing the package
+# does not pull in torch/transformers
+_LAZY_IMPORTS = {
+    "TransformerModel": ".transformer_model",
+    "TextClassifier": ".text_classifier",
+    "TextGenerator": ".text_generator"
+}
 
 __all__ = [
     "TransformerModel",
     "TextClassifier",
     "TextGenerator"
-]
\ No newline at end of file
+]
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
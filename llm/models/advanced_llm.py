@@ -15,9 +15,18 @@ import logging
 from dataclasses import dataclass
 import json
 import os
+from torch.utils.checkpoint import checkpoint
+from safetensors.torch import save_model, load_model
+
+try:
+    from apex.normalization import FusedLayerNorm as LayerNorm
+except ImportError:
+    from torch.nn import LayerNorm
 
 logger = logging.getLogger(__name__)
 
+_HAS_ADDMM_ACTIVATION = hasattr(torch, "_addmm_activation")
+
 @dataclass
 class ModelConfig:
     """Configuration for the language model."""
@@ -29,11 +38,73 @@ class ModelConfig:
     intermediate_size: int = 3072
     dropout: float = 0.1
     layer_norm_eps: float = 1e-12
+    norm_type: str = "layernorm"
+    quantization: Optional[str] = None
+    position_embedding_type: str = "rope"
+    rope_theta: float = 10000.0
     initializer_range: float = 0.02
     pad_token_id: int = 0
     bos_token_id: int = 1
     eos_token_id: int = 2
 
+class RMSNorm(nn.Module):
+    """Root mean square layer normalization (no mean subtraction or bias)."""
+    
+    def __init__(self, hidden_size: int, eps: float = 1e-12):
+        super().__init__()
+        self.eps = eps
+        self.weight = nn.Parameter(torch.ones(hidden_size))
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        variance = x.float().pow(2).mean(-1, keepdim=True)
+        x_normed = x.float() * torch.rsqrt(variance + self.eps)
+        return self.weight * x_normed.to(x.dtype)
+
+def build_norm(norm_type: str, hidden_size: int, eps: float = 1e-12) -> nn.Module:
+    """Create the normalization layer selected by ``norm_type``."""
+    if norm_type == "layernorm":
+        return LayerNorm(hidden_size, eps=eps)
+    if norm_type == "rmsnorm":
+        return RMSNorm(hidden_size, eps=eps)
+    raise ValueError(f"Unsupported norm_type: {norm_type}")
+
+class QuantLinear(nn.Module):
+    """Linear layer with int8 weights and per-output-channel scales.
+    
+    Activations stay in floating point; the int8 weight is cast to the input
+    dtype for the matmul and the per-channel scale is applied to the output.
+    """
+    
+    def __init__(self, in_features: int, out_features: int, bias: bool = True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer("weight_int8", torch.zeros((out_features, in_features), dtype=torch.int8))
+        self.register_buffer("scale", torch.ones(out_features))
+        if bias:
+            self.bias = nn.Parameter(torch.zeros(out_features))
+        else:
+            self.register_parameter("bias", None)
+    
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "QuantLinear":
+        """Quantize an existing linear layer (symmetric, per output channel)."""
+        quant = cls(linear.in_features, linear.out_features, bias=linear.bias is not None)
+        weight = linear.weight.detach()
+        scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127.0
+        
+        quant.weight_int8 = torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8)
+        quant.scale = scale.to(weight.dtype)
+        if linear.bias is not None:
+            quant.bias = nn.Parameter(linear.bias.detach().clone())
+        return quant
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        output = F.linear(x, self.weight_int8.to(x.dtype)) * self.scale.to(x.dtype)
+        if self.bias is not None:
+            output = output + self.bias.to(x.dtype)
+        return output
+
 class PositionalEncoding(nn.Module):
     """Positional encoding for transformer models."""
     
@@ -52,26 +123,127 @@ class PositionalEncoding(nn.Module):
         
         self.register_buffer('pe', pe)
     
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = x + self.pe[:x.size(0), :]
+    def forward(self, x: torch.Tensor, position_ids: Optional[torch.LongTensor] = None) -> torch.Tensor:
+        if position_ids is None:
+            position_ids = torch.arange(x.size(1), device=x.device).unsqueeze(0)
+        x = x + self.pe[position_ids, 0]
         return self.dropout(x)
 
+class RotaryEmbedding(nn.Module):
+    """Rotary position embedding (RoPE) cos/sin tables for query/key rotation."""
+    
+    def __init__(self, head_size: int, base: float = 10000.0):
+        super().__init__()
+        inv_freq = 1.0 / (base ** (torch.arange(0, head_size, 2).float() / head_size))
+        self.register_buffer("inv_freq", inv_freq, persistent=False)
+    
+    def forward(self, position_ids: torch.LongTensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        freqs = position_ids[:, :, None].float() * self.inv_freq[None, None, :]
+        emb = torch.cat((freqs, freqs), dim=-1)
+        
+        # Broadcast over the head dimension: [batch, 1, seq, head_size]
+        return emb.cos()[:, None], emb.sin()[:, None]
+
+def rotate_half(x: torch.Tensor) -> torch.Tensor:
+    """Rotate half the hidden dims of the input."""
+    x1, x2 = x.chunk(2, dim=-1)
+    return torch.cat((-x2, x1), dim=-1)
+
+def apply_rotary_pos_emb(
+    x: torch.Tensor,
+    cos: torch.Tensor,
+    sin: torch.Tensor
+) -> torch.Tensor:
+    """Apply a rotary position embedding to a query or key tensor."""
+    cos = cos.to(x.dtype)
+    sin = sin.to(x.dtype)
+    return (x * cos) + (rotate_half(x) * sin)
+
+class KVCache:
+    """
+    Pre-allocated key/value cache for incremental decoding.
+    
+    Keys and values of every layer live in one contiguous
+    [num_layers, 2, batch, heads, max_length, head_size] buffer. Each forward
+    writes its new positions in place instead of concatenating onto the
+    previous cache, so a decode of T tokens moves O(T) bytes rather than O(T^2).
+    """
+    
+    def __init__(
+        self,
+        num_layers: int,
+        batch_size: int,
+        num_heads: int,
+        max_length: int,
+        head_size: int,
+        device: Optional[torch.device] = None,
+        dtype: torch.dtype = torch.float32
+    ):
+        self.buffer = torch.empty(
+            (num_layers, 2, batch_size, num_heads, max_length, head_size),
+            device=device,
+            dtype=dtype
+        )
+        self.length = 0
+    
+    @property
+    def max_length(self) -> int:
+        return self.buffer.size(4)
+    
+    def update(
+        self,
+        layer_idx: int,
+        key: torch.Tensor,
+        value: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Write new keys/values for a layer and return views over all cached positions."""
+        end = self.length + key.size(2)
+        if end > self.max_length:
+            raise ValueError(f"KV cache overflow: {end} positions exceed max_length {self.max_length}")
+        
+        self.buffer[layer_idx, 0, :, :, self.length:end] = key
+        self.buffer[layer_idx, 1, :, :, self.length:end] = value
+        return self.buffer[layer_idx, 0, :, :, :end], self.buffer[layer_idx, 1, :, :, :end]
+    
+    def advance(self, num_tokens: int):
+        """Mark ``num_tokens`` more positions as filled (after every layer wrote them)."""
+        self.length += num_tokens
+
 class MultiHeadAttention(nn.Module):
     """Multi-head self-attention mechanism."""
     
-    def __init__(self, hidden_size: int, num_attention_heads: int, dropout: float = 0.1):
+    def __init__(
+        self,
+        hidden_size: int,
+        num_attention_heads: int,
+        dropout: float = 0.1,
+        norm_type: str = "layernorm",
+        layer_idx: int = 0
+    ):
         super().__init__()
+        self.layer_idx = layer_idx
         self.num_attention_heads = num_attention_heads
         self.attention_head_size = int(hidden_size / num_attention_heads)
         self.all_head_size = self.num_attention_heads * self.attention_head_size
         
-        self.query = nn.Linear(hidden_size, self.all_head_size)
-        self.key = nn.Linear(hidden_size, self.all_head_size)
-        self.value = nn.Linear(hidden_size, self.all_head_size)
+        # Query, key and value share one projection (a single GEMM)
+        self.qkv = nn.Linear(hidden_size, 3 * self.all_head_size)
         self.dropout = nn.Dropout(dropout)
         self.output = nn.Linear(hidden_size, hidden_size)
         self.output_dropout = nn.Dropout(dropout)
-        self.layer_norm = nn.LayerNorm(hidden_size, eps=1e-12)
+        self.layer_norm = build_norm(norm_type, hidden_size)
+    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # Checkpoints saved before the fused projection store separate
+        # query/key/value linears; stack them into the qkv layout
+        for suffix in ("weight", "bias", "weight_int8", "scale"):
+            old_keys = [f"{prefix}{name}.{suffix}" for name in ("query", "key", "value")]
+            if all(key in state_dict for key in old_keys):
+                state_dict[f"{prefix}qkv.{suffix}"] = torch.cat(
+                    [state_dict.pop(key) for key in old_keys],
+                    dim=0
+                )
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
     
     def transpose_for_scores(self, x: torch.Tensor) -> torch.Tensor:
         new_x_shape = x.size()[:-1] + (self.num_attention_heads, self.attention_head_size)
@@ -83,7 +255,10 @@ class MultiHeadAttention(nn.Module):
         hidden_states: torch.Tensor,
         attention_mask: Optional[torch.Tensor] = None,
         past_key_value: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
-        output_attentions: bool = False
+        output_attentions: bool = False,
+        use_cache: bool = False,
+        rotary_pos_emb: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        kv_cache: Optional[KVCache] = None
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Tuple[torch.Tensor, torch.Tensor]]]:
         
         residual = hidden_states
@@ -91,32 +266,71 @@ class MultiHeadAttention(nn.Module):
         # Apply layer norm
         hidden_states = self.layer_norm(hidden_states)
         
-        mixed_query_layer = self.query(hidden_states)
-        mixed_key_layer = self.key(hidden_states)
-        mixed_value_layer = self.value(hidden_states)
+        mixed_query_layer, mixed_key_layer, mixed_value_layer = self.qkv(hidden_states).split(
+            self.all_head_size,
+            dim=-1
+        )
         
         query_layer = self.transpose_for_scores(mixed_query_layer)
         key_layer = self.transpose_for_scores(mixed_key_layer)
         value_layer = self.transpose_for_scores(mixed_value_layer)
         
+        # Rotate queries and keys; cached keys are stored already rotated
+        if rotary_pos_emb is not None:
+            cos, sin = rotary_pos_emb
+            query_layer = apply_rotary_pos_emb(query_layer, cos, sin)
+            key_layer = apply_rotary_pos_emb(key_layer, cos, sin)
+        
         # Handle past key/value states
-        if past_key_value is not None:
+        if kv_cache is not None:
+            key_layer, value_layer = kv_cache.update(self.layer_idx, key_layer, value_layer)
+        elif past_key_value is not None:
             key_layer = torch.cat([past_key_value[0], key_layer], dim=2)
             value_layer = torch.cat([past_key_value[1], value_layer], dim=2)
         
         present_key_value = (key_layer, value_layer)
         
-        # Compute attention scores
-        attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
-        attention_scores = attention_scores / math.sqrt(self.attention_head_size)
-        
-        if attention_mask is not None:
-            attention_scores = attention_scores + attention_mask
+        # Without an explicit mask, causal masking is only needed when the
+        # queries cover every key (no cached prefix)
+        is_causal = attention_mask is None and query_layer.size(2) == key_layer.size(2)
         
-        attention_probs = F.softmax(attention_scores, dim=-1)
-        attention_probs = self.dropout(attention_probs)
+        if output_attentions:
+            # The fused kernel does not expose attention weights, so compute
+            # them explicitly when they are requested
+            attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
+            attention_scores = attention_scores / math.sqrt(self.attention_head_size)
+            
+            if attention_mask is not None:
+                attention_scores = attention_scores + attention_mask
+            elif is_causal:
+                query_length, key_length = attention_scores.shape[-2:]
+                causal_mask = torch.ones(
+                    (query_length, key_length),
+                    dtype=torch.bool,
+                    device=attention_scores.device
+                ).triu(diagonal=1)
+                attention_scores = attention_scores.masked_fill(
+                    causal_mask,
+                    torch.finfo(attention_scores.dtype).min
+                )
+            
+            attention_probs = F.softmax(attention_scores, dim=-1)
+            attention_probs = self.dropout(attention_probs)
+            
+            context_layer = torch.matmul(attention_probs, value_layer)
+        else:
+            # Fused attention (FlashAttention / memory-efficient kernels) never
+            # materializes the full S x S score matrix. Without an explicit
+            # mask the kernel applies the causal mask itself.
+            context_layer = F.scaled_dot_product_attention(
+                query_layer,
+                key_layer,
+                value_layer,
+                attn_mask=attention_mask,
+                dropout_p=self.dropout.p if self.training else 0.0,
+                is_causal=is_causal
+            )
         
-        context_layer = torch.matmul(attention_probs, value_layer)
         context_layer = context_layer.permute(0, 2, 1, 3).contiguous()
         new_context_layer_shape = context_layer.size()[:-2] + (self.all_head_size,)
         context_layer = context_layer.view(*new_context_layer_shape)
@@ -130,7 +344,7 @@ class MultiHeadAttention(nn.Module):
         outputs = (output,)
         if output_attentions:
             outputs += (attention_probs,)
-        if past_key_value is not None:
+        if use_cache:
             outputs += (present_key_value,)
         
         return outputs
@@ -138,12 +352,18 @@ class MultiHeadAttention(nn.Module):
 class FeedForward(nn.Module):
     """Feed-forward network for transformer blocks."""
     
-    def __init__(self, hidden_size: int, intermediate_size: int, dropout: float = 0.1):
+    def __init__(
+        self,
+        hidden_size: int,
+        intermediate_size: int,
+        dropout: float = 0.1,
+        norm_type: str = "layernorm"
+    ):
         super().__init__()
         self.dense_h_to_4h = nn.Linear(hidden_size, intermediate_size)
         self.dense_4h_to_h = nn.Linear(intermediate_size, hidden_size)
         self.dropout = nn.Dropout(dropout)
-        self.layer_norm = nn.LayerNorm(hidden_size, eps=1e-12)
+        self.layer_norm = build_norm(norm_type, hidden_size)
         self.activation = nn.GELU()
     
     def forward(self, hidden_states: torch.Tensor) -> torch.Tensor:
@@ -152,8 +372,30 @@ class FeedForward(nn.Module):
         # Apply layer norm
         hidden_states = self.layer_norm(hidden_states)
         
-        hidden_states = self.dense_h_to_4h(hidden_states)
-        hidden_states = self.activation(hidden_states)
+        # _addmm_activation has no autograd formula, and on CUDA its cuBLASLt
+        # epilogue computes the tanh GELU approximation, so the fused path is
+        # limited to inference where it matches self.activation; elsewhere
+        # torch.compile fuses the unfused ops
+        use_fused = (
+            _HAS_ADDMM_ACTIVATION
+            and not torch.is_grad_enabled()
+            and isinstance(self.dense_h_to_4h, nn.Linear)
+            and (hidden_states.device.type != "cuda" or self.activation.approximate == "tanh")
+        )
+        
+        if use_fused:
+            # Bias add and GELU run as the matmul epilogue instead of two
+            # extra passes over the intermediate activations
+            input_shape = hidden_states.shape
+            hidden_states = torch._addmm_activation(
+                self.dense_h_to_4h.bias,
+                hidden_states.reshape(-1, input_shape[-1]),
+                self.dense_h_to_4h.weight.t(),
+                use_gelu=True
+            ).view(*input_shape[:-1], -1)
+        else:
+            hidden_states = self.dense_h_to_4h(hidden_states)
+            hidden_states = self.activation(hidden_states)
         hidden_states = self.dense_4h_to_h(hidden_states)
         hidden_states = self.dropout(hidden_states)
         
@@ -165,17 +407,20 @@ class FeedForward(nn.Module):
 class TransformerBlock(nn.Module):
     """A single transformer block with attention and feed-forward layers."""
     
-    def __init__(self, config: ModelConfig):
+    def __init__(self, config: ModelConfig, layer_idx: int = 0):
         super().__init__()
         self.attention = MultiHeadAttention(
             config.hidden_size,
             config.num_attention_heads,
-            config.dropout
+            config.dropout,
+            config.norm_type,
+            layer_idx=layer_idx
         )
         self.feed_forward = FeedForward(
             config.hidden_size,
             config.intermediate_size,
-            config.dropout
+            config.dropout,
+            config.norm_type
         )
     
     def forward(
@@ -183,14 +428,20 @@ class TransformerBlock(nn.Module):
         hidden_states: torch.Tensor,
         attention_mask: Optional[torch.Tensor] = None,
         past_key_value: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
-        output_attentions: bool = False
+        output_attentions: bool = False,
+        use_cache: bool = False,
+        rotary_pos_emb: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+        kv_cache: Optional[KVCache] = None
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Tuple[torch.Tensor, torch.Tensor]]]:
         
         attention_outputs = self.attention(
             hidden_states,
             attention_mask=attention_mask,
             past_key_value=past_key_value,
-            output_attentions=output_attentions
+            output_attentions=output_attentions,
+            use_cache=use_cache,
+            rotary_pos_emb=rotary_pos_emb,
+            kv_cache=kv_cache
         )
         
         attention_output = attention_outputs[0]
@@ -208,7 +459,7 @@ class AdvancedLLM(nn.Module):
     
     A complete transformer-based language model with:
     - Multi-head self-attention
-    - Positional encoding
+    - Rotary or sinusoidal positional encoding
     - Layer normalization
     - Residual connections
     - Configurable architecture
@@ -221,20 +472,48 @@ class AdvancedLLM(nn.Module):
         # Token embedding
         self.embedding = nn.Embedding(config.vocab_size, config.hidden_size)
         
-        # Positional encoding
-        self.positional_encoding = PositionalEncoding(
-            config.hidden_size,
-            config.max_seq_length,
-            config.dropout
+        # Positional encoding: RoPE rotates queries/keys inside attention,
+        # the sinusoidal table is added to the embeddings
+        self.embedding_dropout = nn.Dropout(config.dropout)
+        if config.position_embedding_type == "rope":
+            self.positional_encoding = None
+            self.rotary_embedding = RotaryEmbedding(
+                config.hidden_size // config.num_attention_heads,
+                config.rope_theta
+            )
+        elif config.position_embedding_type == "sinusoidal":
+            self.positional_encoding = PositionalEncoding(
+                config.hidden_size,
+                config.max_seq_length,
+                config.dropout
+            )
+            self.rotary_embedding = None
+        else:
+            raise ValueError(f"Unsupported position_embedding_type: {config.position_embedding_type}")
+        
+        # Causal mask built once and sliced per forward; True marks a blocked key
+        self.register_buffer(
+            "causal_mask",
+            torch.ones(
+                (config.max_seq_length, config.max_seq_length),
+                dtype=torch.bool
+            ).triu(diagonal=1),
+            persistent=False
         )
         
         # Transformer blocks
         self.layers = nn.ModuleList([
-            TransformerBlock(config) for _ in range(config.num_layers)
+            TransformerBlock(config, layer_idx=i) for i in range(config.num_layers)
         ])
         
+        # Recompute block activations in backward instead of storing them
+        self.gradient_checkpointing = False
+        
+        # Compiled layer stack used on the plain forward path (see compile_layers)
+        self._compiled_run_layers = None
+        
         # Final layer norm
-        self.final_layer_norm = nn.LayerNorm(config.hidden_size, eps=config.layer_norm_eps)
+        self.final_layer_norm = build_norm(config.norm_type, config.hidden_size, config.layer_norm_eps)
         
         # Output projection
         self.lm_head = nn.Linear(config.hidden_size, config.vocab_size, bias=False)
@@ -255,9 +534,51 @@ class AdvancedLLM(nn.Module):
             module.weight.data.normal_(mean=0.0, std=self.config.initializer_range)
             if module.padding_idx is not None:
                 module.weight.data[module.padding_idx].zero_()
-        elif isinstance(module, nn.LayerNorm):
+        elif isinstance(module, (nn.LayerNorm, LayerNorm)):
             module.bias.data.zero_()
             module.weight.data.fill_(1.0)
+        elif isinstance(module, RMSNorm):
+            module.weight.data.fill_(1.0)
+    
+    def gradient_checkpointing_enable(self):
+        """Enable activation checkpointing for the transformer blocks."""
+        self.gradient_checkpointing = True
+    
+    def gradient_checkpointing_disable(self):
+        """Disable activation checkpointing for the transformer blocks."""
+        self.gradient_checkpointing = False
+    
+    def compile_layers(self, mode: str = "default", dynamic: bool = True):
+        """
+        Compile the transformer layer stack with torch.compile.
+        
+        The compiled stack is used whenever no per-layer outputs (attentions,
+        hidden states or tuple caches) are requested and gradient
+        checkpointing is off; other calls keep the eager loop.
+        
+        Args:
+            mode: torch.compile mode
+            dynamic: Compile with symbolic shapes so changing sequence and
+                cache lengths do not trigger recompiles
+        """
+        self._compiled_run_layers = torch.compile(self._run_layers, mode=mode, dynamic=dynamic)
+    
+    def _run_layers(
+        self,
+        hidden_states: torch.Tensor,
+        attention_mask: Optional[torch.Tensor],
+        rotary_pos_emb: Optional[Tuple[torch.Tensor, torch.Tensor]],
+        kv_cache: Optional[KVCache]
+    ) -> torch.Tensor:
+        """Run every transformer block, returning only the final hidden states."""
+        for layer in self.layers:
+            hidden_states = layer(
+                hidden_states,
+                attention_mask=attention_mask,
+                rotary_pos_emb=rotary_pos_emb,
+                kv_cache=kv_cache
+            )[0]
+        return hidden_states
     
     def get_input_embeddings(self):
         return self.embedding
@@ -273,65 +594,135 @@ class AdvancedLLM(nn.Module):
         position_ids: Optional[torch.LongTensor] = None,
         output_attentions: bool = False,
         output_hidden_states: bool = False,
-        return_dict: bool = True
+        return_dict: bool = True,
+        use_cache: bool = False,
+        kv_cache: Optional[KVCache] = None,
+        num_logits_to_keep: int = 0
     ) -> Dict[str, torch.Tensor]:
         
         batch_size, seq_length = input_ids.shape
-        
-        if attention_mask is None:
-            attention_mask = torch.ones((batch_size, seq_length), device=input_ids.device)
+        if kv_cache is not None:
+            past_length = kv_cache.length
+        elif past_key_values is not None:
+            past_length = past_key_values[0][0].size(2)
+        else:
+            past_length = 0
         
         if position_ids is None:
-            position_ids = torch.arange(seq_length, dtype=torch.long, device=input_ids.device)
+            position_ids = torch.arange(
+                past_length,
+                past_length + seq_length,
+                dtype=torch.long,
+                device=input_ids.device
+            )
             position_ids = position_ids.unsqueeze(0).expand_as(input_ids)
         
-        # Create causal attention mask
-        causal_mask = torch.triu(
-            torch.ones((seq_length, seq_length), device=input_ids.device),
-            diagonal=1
-        ).bool()
-        causal_mask = causal_mask.unsqueeze(0).unsqueeze(0)
-        
-        # Combine attention masks
-        attention_mask = attention_mask.unsqueeze(1).unsqueeze(2)
-        attention_mask = attention_mask.to(dtype=torch.float32)
-        attention_mask = (1.0 - attention_mask) * -10000.0
-        
         # Get embeddings
         hidden_states = self.embedding(input_ids)
-        hidden_states = self.positional_encoding(hidden_states.transpose(0, 1)).transpose(0, 1)
+        
+        # Without padding the attention kernel applies the causal mask itself
+        # (a single cached decode step needs none); otherwise combine causal
+        # and padding masks once into an additive mask shared by every layer
+        if attention_mask is None and (past_length == 0 or seq_length == 1):
+            extended_attention_mask = None
+        else:
+            key_length = past_length + seq_length
+            if attention_mask is None:
+                attention_mask = torch.ones((batch_size, key_length), device=input_ids.device)
+            
+            causal_mask = self.causal_mask[past_length:key_length, :key_length]
+            padding_mask = attention_mask[:, None, None, :] == 0
+            
+            # Under autocast the attention scores are in the autocast dtype,
+            # so the additive mask has to match it
+            if hidden_states.is_cuda and torch.is_autocast_enabled():
+                mask_dtype = torch.get_autocast_gpu_dtype()
+            else:
+                mask_dtype = hidden_states.dtype
+            
+            extended_attention_mask = torch.zeros(
+                (batch_size, 1, seq_length, key_length),
+                dtype=mask_dtype,
+                device=input_ids.device
+            ).masked_fill(causal_mask | padding_mask, torch.finfo(mask_dtype).min)
+        
+        if self.rotary_embedding is not None:
+            hidden_states = self.embedding_dropout(hidden_states)
+            rotary_pos_emb = self.rotary_embedding(position_ids)
+        else:
+            hidden_states = self.positional_encoding(hidden_states, position_ids)
+            rotary_pos_emb = None
         
         all_hidden_states = () if output_hidden_states else None
         all_attentions = () if output_attentions else None
-        next_cache = () if past_key_values is not None else None
+        next_cache = () if use_cache else None
         
-        for i, layer in enumerate(self.layers):
-            if output_hidden_states:
-                all_hidden_states = all_hidden_states + (hidden_states,)
-            
-            past_key_value = past_key_values[i] if past_key_values is not None else None
-            
-            layer_outputs = layer(
+        use_compiled = (
+            self._compiled_run_layers is not None
+            and not (output_hidden_states or output_attentions or use_cache)
+            and past_key_values is None
+            and not (self.gradient_checkpointing and self.training)
+        )
+        
+        if use_compiled:
+            hidden_states = self._compiled_run_layers(
                 hidden_states,
-                attention_mask=attention_mask,
-                past_key_value=past_key_value,
-                output_attentions=output_attentions
+                extended_attention_mask,
+                rotary_pos_emb,
+                kv_cache
             )
-            
-            hidden_states = layer_outputs[0]
-            
-            if output_attentions:
-                all_attentions = all_attentions + (layer_outputs[1],)
-            
-            if past_key_values is not None:
-                next_cache = next_cache + (layer_outputs[-1],)
+        else:
+            for i, layer in enumerate(self.layers):
+                if output_hidden_states:
+                    all_hidden_states = all_hidden_states + (hidden_states,)
+                
+                past_key_value = past_key_values[i] if past_key_values is not None else None
+                
+                if self.gradient_checkpointing and self.training:
+                    layer_outputs = checkpoint(
+                        layer,
+                        hidden_states,
+                        attention_mask=extended_attention_mask,
+                        past_key_value=past_key_value,
+                        output_attentions=output_attentions,
+                        use_cache=use_cache,
+                        rotary_pos_emb=rotary_pos_emb,
+                        kv_cache=kv_cache,
+                        use_reentrant=False
+                    )
+                else:
+                    layer_outputs = layer(
+                        hidden_states,
+                        attention_mask=extended_attention_mask,
+                        past_key_value=past_key_value,
+                        output_attentions=output_attentions,
+                        use_cache=use_cache,
+                        rotary_pos_emb=rotary_pos_emb,
+                        kv_cache=kv_cache
+                    )
+                
+                hidden_states = layer_outputs[0]
+                
+                if output_attentions:
+                    all_attentions = all_attentions + (layer_outputs[1],)
+                
+                if use_cache:
+                    next_cache = next_cache + (layer_outputs[-1],)
+        
+        if kv_cache is not None:
+            kv_cache.advance(seq_length)
         
         hidden_states = self.final_layer_norm(hidden_states)
         
         if output_hidden_states:
             all_hidden_states = all_hidden_states + (hidden_states,)
         
-        logits = self.lm_head(hidden_states)
+        # Project only the trailing positions when the caller needs just
+        # those (0 keeps every position)
+        if num_logits_to_keep > 0:
+            logits = self.lm_head(hidden_states[:, -num_logits_to_keep:, :])
+        else:
+            logits = self.lm_head(hidden_states)
         
         return {
             "logits": logits,
@@ -340,6 +731,35 @@ class AdvancedLLM(nn.Module):
             "past_key_values": next_cache
         }
     
+    def allocate_kv_cache(
+        self,
+        batch_size: int,
+        max_length: int,
+        device: Optional[torch.device] = None,
+        dtype: Optional[torch.dtype] = None
+    ) -> KVCache:
+        """
+        Allocate a key/value cache for incremental decoding.
+        
+        Args:
+            batch_size: Number of sequences decoded together
+            max_length: Maximum total sequence length (prompt + generated)
+            device: Device for the cache (defaults to the model's device)
+            dtype: Cache dtype (defaults to the model's parameter dtype)
+            
+        Returns:
+            An empty KVCache
+        """
+        return KVCache(
+            num_layers=self.config.num_layers,
+            batch_size=batch_size,
+            num_heads=self.config.num_attention_heads,
+            max_length=max_length,
+            head_size=self.config.hidden_size // self.config.num_attention_heads,
+            device=device or self.embedding.weight.device,
+            dtype=dtype or self.embedding.weight.dtype
+        )
+    
     def generate(
         self,
         input_ids: torch.LongTensor,
@@ -350,7 +770,8 @@ class AdvancedLLM(nn.Module):
         do_sample: bool = True,
         pad_token_id: Optional[int] = None,
         eos_token_id: Optional[int] = None,
-        repetition_penalty: float = 1.0
+        repetition_penalty: float = 1.0,
+        eos_check_interval: int = 32
     ) -> torch.LongTensor:
         """
         Generate text using the language model.
@@ -365,6 +786,8 @@ class AdvancedLLM(nn.Module):
             pad_token_id: Padding token ID
             eos_token_id: End-of-sequence token ID
             repetition_penalty: Penalty for repetition
+            eos_check_interval: Number of steps between host-side checks for
+                whether every sequence has finished
             
         Returns:
             Generated token IDs
@@ -375,68 +798,108 @@ class AdvancedLLM(nn.Module):
         batch_size = input_ids.shape[0]
         current_length = input_ids.shape[1]
         
-        # Initialize past key values for efficient generation
-        past_key_values = None
+        # Key/value cache written in place; after the prompt only the newest
+        # token is fed
+        kv_cache = self.allocate_kv_cache(batch_size, max_length, device=input_ids.device)
         
         generated = input_ids.clone()
+        next_input_ids = input_ids
+        
+        # EOS tracking stays on the device so a step never waits on the host
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=input_ids.device)
         
-        for _ in range(max_length - current_length):
+        for step in range(max_length - current_length):
             # Get model outputs
             outputs = self.forward(
-                input_ids=generated,
-                past_key_values=past_key_values,
-                return_dict=True
+                input_ids=next_input_ids,
+                return_dict=True,
+                kv_cache=kv_cache,
+                num_logits_to_keep=1
             )
             
             logits = outputs["logits"][:, -1, :] / temperature
-            past_key_values = outputs["past_key_values"]
             
-            # Apply repetition penalty
+            # Apply repetition penalty to every previously generated token
+            # (except padding) in one gather/scatter over the logits
             if repetition_penalty != 1.0:
-                for i in range(batch_size):
-                    for previous_token in set(generated[i].tolist()):
-                        if previous_token != pad_token_id:
-                            logits[i, previous_token] /= repetition_penalty
-            
-            # Apply top-k filtering
-            if top_k > 0:
-                indices_to_remove = logits < torch.topk(logits, top_k)[0][..., -1, None]
-                logits[indices_to_remove] = -float('Inf')
-            
-            # Apply top-p (nucleus) filtering
-            if top_p < 1.0:
-                sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-                cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
-                
-                sorted_indices_to_remove = cumulative_probs > top_p
-                sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
-                sorted_indices_to_remove[..., 0] = 0
-                
-                indices_to_remove = sorted_indices_to_remove.scatter(1, sorted_indices, sorted_indices_to_remove)
-                logits[indices_to_remove] = -float('Inf')
+                score = torch.gather(logits, 1, generated)
+                penalized = torch.where(
+                    score < 0,
+                    score * repetition_penalty,
+                    score / repetition_penalty
+                )
+                score = torch.where(generated != pad_token_id, penalized, score)
+                logits.scatter_(1, generated, score)
             
             # Sample next token
             if do_sample:
-                probs = F.softmax(logits, dim=-1)
-                next_token = torch.multinomial(probs, num_samples=1)
+                # Apply top-k filtering; top-p then only works on the k
+                # candidates, already in descending order, so the full
+                # vocabulary is never sorted
+                k = min(top_k, logits.size(-1)) if top_k > 0 else logits.size(-1)
+                top_logits, top_indices = torch.topk(logits, k, dim=-1)
+                
+                # Apply top-p (nucleus) filtering: drop a candidate once the
+                # probability mass before it already exceeds top_p
+                if top_p < 1.0:
+                    probs = F.softmax(top_logits, dim=-1)
+                    cumulative_probs = probs.cumsum(dim=-1)
+                    top_logits = top_logits.masked_fill(cumulative_probs - probs > top_p, -float('Inf'))
+                
+                # Gumbel-max: argmax of logits plus Gumbel noise is a sample
+                # from their softmax; filtered (-inf) candidates never win
+                uniform = torch.rand_like(top_logits).clamp_min_(1e-20)
+                gumbel = -torch.log(-torch.log(uniform))
+                next_token = top_indices.gather(-1, (top_logits + gumbel).argmax(dim=-1, keepdim=True))
             else:
+                # Filtering never removes the highest logit, so greedy
+                # decoding can skip it
                 next_token = torch.argmax(logits, dim=-1, keepdim=True)
             
+            # Sequences that already produced EOS keep emitting padding
+            if eos_token_id is not None:
+                next_token = next_token.masked_fill(finished[:, None], pad_token_id)
+                finished |= next_token.squeeze(-1) == eos_token_id
+            
             # Append to generated sequence
             generated = torch.cat([generated, next_token], dim=-1)
+            next_input_ids = next_token
             
-            # Check for EOS token
-            if eos_token_id is not None and (next_token == eos_token_id).any():
+            # Stop early once every sequence is done, syncing only periodically
+            if (
+                eos_token_id is not None
+                and (step + 1) % eos_check_interval == 0
+                and bool(finished.all())
+            ):
                 break
         
         return generated
     
+    def quantize_int8(self):
+        """
+        Replace the transformer linears with int8 weight-only QuantLinear layers.
+        
+        The lm_head is tied to the token embedding and is left unquantized.
+        
+        Returns:
+            The model itself, for chaining
+        """
+        for layer in self.layers:
+            for module in (layer.attention, layer.feed_forward):
+                for name, child in list(module.named_children()):
+                    if isinstance(child, nn.Linear):
+                        setattr(module, name, QuantLinear.from_linear(child))
+        
+        self.config.quantization = "int8"
+        logger.info("Quantized transformer linear layers to int8")
+        return self
+    
     def save_pretrained(self, save_directory: str):
         """Save the model to a directory."""
         os.makedirs(save_directory, exist_ok=True)
         
-        # Save model weights
-        torch.save(self.state_dict(), os.path.join(save_directory, "pytorch_model.bin"))
+        # Save model weights (safetensors dedupes the tied embedding/lm_head)
+        save_model(self, os.path.join(save_directory, "model.safetensors"))
         
         # Save configuration
         config_dict = {
@@ -448,6 +911,10 @@ class AdvancedLLM(nn.Module):
             "intermediate_size": self.config.intermediate_size,
             "dropout": self.config.dropout,
             "layer_norm_eps": self.config.layer_norm_eps,
+            "norm_type": self.config.norm_type,
+            "quantization": self.config.quantization,
+            "position_embedding_type": self.config.position_embedding_type,
+            "rope_theta": self.config.rope_theta,
             "initializer_range": self.config.initializer_range,
             "pad_token_id": self.config.pad_token_id,
             "bos_token_id": self.config.bos_token_id,
@@ -463,6 +930,7 @@ class AdvancedLLM(nn.Module):
     def from_pretrained(cls, model_directory: str, **kwargs):
         """Load a model from a directory."""
         config_path = os.path.join(model_directory, "config.json")
+        safetensors_path = os.path.join(model_directory, "model.safetensors")
         model_path = os.path.join(model_directory, "pytorch_model.bin")
         
         if not os.path.exists(config_path):
@@ -471,15 +939,82 @@ class AdvancedLLM(nn.Module):
         with open(config_path, "r") as f:
             config_dict = json.load(f)
         
+        # Configs written before RoPE was added were trained with the
+        # sinusoidal table
+        config_dict.setdefault("position_embedding_type", "sinusoidal")
+        quantization = config_dict.pop("quantization", None)
         config = ModelConfig(**config_dict)
         model = cls(config, **kwargs)
         
-        if os.path.exists(model_path):
+        # Quantized checkpoints store int8 weights, so the layers must be
+        # swapped before the state dict is loaded
+        if quantization == "int8":
+            model.quantize_int8()
+        
+        # safetensors memory-maps the file instead of unpickling it; the
+        # legacy pickle checkpoint is only used when no safetensors file exists
+        if os.path.exists(safetensors_path):
+            load_model(model, safetensors_path)
+            logger.info(f"Model loaded from {model_directory}")
+        elif os.path.exists(model_path):
             model.load_state_dict(torch.load(model_path, map_location="cpu"))
             logger.info(f"Model loaded from {model_directory}")
         
         return model
 
+class CUDAPrefetcher:
+    """
+    Iterate a DataLoader while copying the next batch to the device.
+    
+    On CUDA the copy runs on a dedicated stream so it overlaps with the
+    current step; use a DataLoader with pin_memory=True for the copies to be
+    asynchronous. On other devices batches are simply moved as they come.
+    """
+    
+    def __init__(self, dataloader, device: str):
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.stream = torch.cuda.Stream(device=self.device) if self.device.type == "cuda" else None
+    
+    def __len__(self):
+        return len(self.dataloader)
+    
+    def _to_device(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            key: value.to(self.device, non_blocking=True) if isinstance(value, torch.Tensor) else value
+            for key, value in batch.items()
+        }
+    
+    def _preload(self, iterator) -> Optional[Dict[str, Any]]:
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return self._to_device(batch)
+    
+    def __iter__(self):
+        if self.stream is None:
+            for batch in self.dataloader:
+                yield self._to_device(batch)
+            return
+        
+        iterator = iter(self.dataloader)
+        next_batch = self._preload(iterator)
+        
+        while next_batch is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(self.stream)
+            batch = next_batch
+            
+            # Tell the allocator these tensors are now used on the compute stream
+            for value in batch.values():
+                if isinstance(value, torch.Tensor):
+                    value.record_stream(current_stream)
+            
+            next_batch = self._preload(iterator)
+            yield batch
+
 class LLMTrainer:
     """Trainer class for the language model."""
     
@@ -487,13 +1022,38 @@ class LLMTrainer:
         self,
         model: AdvancedLLM,
         tokenizer,
-        device: str = "cuda" if torch.cuda.is_available() else "cpu"
+        device: str = "cuda" if torch.cuda.is_available() else "cpu",
+        compile_model: bool = False,
+        compile_mode: str = "max-autotune",
+        use_amp: bool = True,
+        gradient_checkpointing: bool = False
     ):
+        if gradient_checkpointing:
+            model.gradient_checkpointing_enable()
+        
         self.model = model.to(device)
         self.tokenizer = tokenizer
         self.device = device
         self.optimizer = None
         self.scheduler = None
+        self.compile_model = compile_model
+        
+        # Mixed precision: bf16 where supported, otherwise fp16 with loss scaling
+        self.use_amp = use_amp and str(device).startswith("cuda")
+        if self.use_amp and torch.cuda.is_bf16_supported():
+            self.amp_dtype = torch.bfloat16
+        else:
+            self.amp_dtype = torch.float16
+        self.scaler = torch.cuda.amp.GradScaler(
+            enabled=self.use_amp and self.amp_dtype == torch.float16
+        )
+        
+        # Compiled wrapper shares parameters with self.model, so saving and
+        # the optimizer keep working on the plain module
+        if compile_model:
+            self.forward_model = torch.compile(self.model, mode=compile_mode, dynamic=False)
+        else:
+            self.forward_model = self.model
     
     def setup_training(
         self,
@@ -503,10 +1063,12 @@ class LLMTrainer:
         total_steps: int = 100000
     ):
         """Setup optimizer and scheduler for training."""
+        # The fused CUDA kernel updates every parameter in one launch
         self.optimizer = torch.optim.AdamW(
             self.model.parameters(),
             lr=learning_rate,
-            weight_decay=weight_decay
+            weight_decay=weight_decay,
+            fused=str(self.device).startswith("cuda")
         )
         
         self.scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(
@@ -519,31 +1081,39 @@ class LLMTrainer:
         """Perform a single training step."""
         self.model.train()
         
-        input_ids = batch["input_ids"].to(self.device)
+        input_ids = batch["input_ids"].to(self.device, non_blocking=True)
         attention_mask = batch.get("attention_mask", None)
         if attention_mask is not None:
-            attention_mask = attention_mask.to(self.device)
-        
-        # Forward pass
-        outputs = self.model(
-            input_ids=input_ids,
-            attention_mask=attention_mask
-        )
+            attention_mask = attention_mask.to(self.device, non_blocking=True)
         
-        logits = outputs["logits"]
+        if self.compile_model:
+            # Fixed-length batches avoid recompiling for every new shape
+            torch._dynamo.mark_static(input_ids, 1)
         
-        # Calculate loss (shifted language modeling)
-        shift_logits = logits[..., :-1, :].contiguous()
-        shift_labels = input_ids[..., 1:].contiguous()
-        
-        loss_fct = nn.CrossEntropyLoss()
-        loss = loss_fct(shift_logits.view(-1, shift_logits.size(-1)), shift_labels.view(-1))
+        with torch.autocast(device_type="cuda", dtype=self.amp_dtype, enabled=self.use_amp):
+            # Forward pass
+            outputs = self.forward_model(
+                input_ids=input_ids,
+                attention_mask=attention_mask
+            )
+            
+            logits = outputs["logits"]
+            
+            # Calculate loss (shifted language modeling) in fp32 so large
+            # logits cannot overflow the softmax
+            shift_logits = logits[..., :-1, :].float().contiguous()
+            shift_labels = input_ids[..., 1:].contiguous()
+            
+            loss_fct = nn.CrossEntropyLoss()
+            loss = loss_fct(shift_logits.view(-1, shift_logits.size(-1)), shift_labels.view(-1))
         
-        # Backward pass
-        self.optimizer.zero_grad()
-        loss.backward()
+        # Backward pass (the scaler is a pass-through unless training in fp16)
+        self.optimizer.zero_grad(set_to_none=True)
+        self.scaler.scale(loss).backward()
+        self.scaler.unscale_(self.optimizer)
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
-        self.optimizer.step()
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
         self.scheduler.step()
         
         return {"loss": loss.item()}
@@ -555,19 +1125,18 @@ class LLMTrainer:
         num_batches = 0
         
         with torch.no_grad():
-            for batch in eval_dataloader:
-                input_ids = batch["input_ids"].to(self.device)
+            for batch in CUDAPrefetcher(eval_dataloader, self.device):
+                input_ids = batch["input_ids"]
                 attention_mask = batch.get("attention_mask", None)
-                if attention_mask is not None:
-                    attention_mask = attention_mask.to(self.device)
                 
-                outputs = self.model(
-                    input_ids=input_ids,
-                    attention_mask=attention_mask
-                )
+                with torch.autocast(device_type="cuda", dtype=self.amp_dtype, enabled=self.use_amp):
+                    outputs = self.forward_model(
+                        input_ids=input_ids,
+                        attention_mask=attention_mask
+                    )
                 
                 logits = outputs["logits"]
-                shift_logits = logits[..., :-1, :].contiguous()
+                shift_logits = logits[..., :-1, :].float().contiguous()
                 shift_labels = input_ids[..., 1:].contiguous()
                 
                 loss_fct = nn.CrossEntropyLoss()
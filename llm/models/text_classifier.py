@@ -7,17 +7,23 @@ topic classification, and intent detection.
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from transformers import (
     AutoTokenizer,
     AutoModelForSequenceClassification,
     pipeline
 )
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Union, Iterator
 import logging
 import numpy as np
 from sklearn.metrics import classification_report, confusion_matrix
 import json
 import os
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from ..utils.batching import BatchScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +44,9 @@ class TextClassifier:
         labels: Optional[List[str]] = None,
         device: Optional[str] = None,
         cache_dir: Optional[str] = None,
+        compile_model: bool = False,
+        onnx_int8: bool = False,
+        int8: bool = False,
         **kwargs
     ):
         """
@@ -48,18 +57,31 @@ class TextClassifier:
             labels: List of class labels
             device: Device to run the model on
             cache_dir: Directory to cache model files
+            compile_model: Whether to compile the model forward with torch.compile
+            onnx_int8: On CPU, run a dynamically INT8-quantized ONNX Runtime
+                export of the model instead of PyTorch (requires optimum)
+            int8: On CPU, dynamically quantize the Linear layers of the
+                PyTorch model to INT8
             **kwargs: Additional arguments for model initialization
         """
         self.model_name = model_name
         self.labels = labels
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.cache_dir = cache_dir
+        self.compile_model = compile_model
+        self.onnx_int8 = onnx_int8 and self.device == "cpu"
+        self.int8 = int8 and self.device == "cpu" and not self.onnx_int8
+        self._batch_scheduler = None
+        self._replica_pipelines = None
+        
+        # Per-instance LRU of device tensors for repeated texts
+        self._tokenize_cached = lru_cache(maxsize=1024)(self._tokenize)
         
         logger.info(f"Initializing text classifier: {model_name} on {self.device}")
         
         # Initialize tokenizer and model
         self._initialize_model(**kwargs)
-        
+    
     def _initialize_model(self, **kwargs):
         """Initialize the model and tokenizer."""
         try:
@@ -75,15 +97,41 @@ class TextClassifier:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
             # Load model
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                self.model_name,
-                cache_dir=self.cache_dir,
-                **kwargs
-            )
+            self._num_parameters = None
+            if self.onnx_int8:
+                self.model = self._load_onnx_int8_model(**kwargs)
+            else:
+                self.model = AutoModelForSequenceClassification.from_pretrained(
+                    self.model_name,
+                    cache_dir=self.cache_dir,
+                    **kwargs
+                )
+                
+                # Move model to device
+                self.model.to(self.device)
+                self.model.eval()
+                
+                # Count once, before quantization packs the Linear weights
+                self._num_parameters = sum(p.numel() for p in self.model.parameters())
+                
+                # INT8 weights with dynamically quantized activations (VNNI GEMMs)
+                if self.int8:
+                    self.model = torch.quantization.quantize_dynamic(
+                        self.model,
+                        {nn.Linear},
+                        dtype=torch.qint8
+                    )
             
-            # Move model to device
-            self.model.to(self.device)
-            self.model.eval()
+            # Compile the forward in place (before the pipeline is built) so the
+            # pipeline, generate() and direct calls all go through it
+            if self.compile_model and not self.onnx_int8:
+                self.model.forward = torch.compile(
+                    self.model.forward,
+                    mode="reduce-overhead",
+                    fullgraph=False,
+                    dynamic=True
+                )
+                self._warmup_model()
             
             # Create pipeline
             self.pipeline = pipeline(
@@ -98,11 +146,76 @@ class TextClassifier:
                 self.labels = list(self.model.config.id2label.values())
             
             logger.info(f"Text classifier {self.model_name} loaded successfully")
-            
+        
         except Exception as e:
             logger.error(f"Error loading text classifier {self.model_name}: {str(e)}")
             raise
     
+    def _load_onnx_int8_model(self, **kwargs):
+        """Export the model to ONNX and quantize it to INT8 (cached on disk)."""
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        
+        onnx_dir = os.path.join(
+            self.cache_dir or ".",
+            "onnx_int8",
+            self.model_name.replace("/", "--")
+        )
+        quantized_file = "model_quantized.onnx"
+        
+        if not os.path.exists(os.path.join(onnx_dir, quantized_file)):
+            ort_model = ORTModelForSequenceClassification.from_pretrained(
+                self.model_name,
+                export=True,
+                cache_dir=self.cache_dir,
+                **kwargs
+            )
+            
+            # Dynamic quantization targeting AVX-512 VNNI int8 dot products
+            quantizer = ORTQuantizer.from_pretrained(ort_model)
+            quantizer.quantize(
+                save_dir=onnx_dir,
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            )
+            logger.info(f"Exported INT8 ONNX model for {self.model_name} to {onnx_dir}")
+        
+        return ORTModelForSequenceClassification.from_pretrained(onnx_dir, file_name=quantized_file)
+    
+    def _static_length(self, longest: int) -> int:
+        """Smallest fixed padding bucket that fits a sequence of the given length."""
+        for bucket in (128, 256, 512):
+            if longest <= bucket:
+                return bucket
+        return 512
+    
+    def _tokenize(self, text: str, max_length: int):
+        """
+        Tokenize a text and move it to the model device.
+        
+        Results are shared through _tokenize_cached, so callers must not
+        modify the returned tensors in place.
+        """
+        return self.tokenizer(
+            text,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=max_length
+        ).to(self.device)
+    
+    def _warmup_model(self):
+        """Run one forward pass so the compile cost is paid at load time."""
+        inputs = self.tokenizer(
+            "Warmup input for model compilation.",
+            return_tensors="pt",
+            truncation=True
+        ).to(self.device)
+        
+        with torch.inference_mode():
+            self.model(**inputs)
+        
+        logger.info(f"Compiled and warmed up {self.model_name}")
+    
     def classify(self, text: str) -> Dict[str, Any]:
         """
         Classify the given text.
@@ -116,19 +229,80 @@ class TextClassifier:
         result = self.pipeline(text)
         return result[0]
     
-    def classify_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+    def classify_batch(self, texts: List[str], batch_size: int = 32) -> List[Dict[str, Any]]:
         """
         Classify a batch of texts.
         
         Args:
             texts: List of input texts
+            batch_size: Number of texts per model forward pass
             
         Returns:
             List of classification results
         """
-        results = self.pipeline(texts)
+        return self._classify_buckets(self.pipeline, texts, batch_size)
+    
+    def _classify_buckets(self, classifier_pipeline, texts: List[str], batch_size: int) -> List[Dict[str, Any]]:
+        """Run a pipeline over length-sorted buckets of texts and restore the input order."""
+        if not texts:
+            return []
+        
+        # Sort by token length so each batch holds similarly sized texts
+        # and little compute is spent on padding
+        lengths = [len(ids) for ids in classifier_pipeline.tokenizer(texts, truncation=True, max_length=512)["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+        
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            bucket = [texts[i] for i in indices]
+            
+            if self.onnx_int8:
+                # Fixed-shape buckets let ONNX Runtime reuse its optimized plan
+                padding_kwargs = {
+                    "padding": "max_length",
+                    "max_length": self._static_length(lengths[indices[-1]])
+                }
+            else:
+                # Pad to multiples of 8 so batch shapes map well onto tensor cores
+                padding_kwargs = {
+                    "padding": "longest",
+                    "pad_to_multiple_of": 8,
+                    "max_length": 512
+                }
+            
+            outputs = classifier_pipeline(bucket, batch_size=len(bucket), truncation=True, **padding_kwargs)
+            
+            # Scatter results back to the input order
+            for index, output in zip(indices, outputs):
+                results[index] = output
+        
         return results
     
+    async def classify_async(self, text: str) -> Dict[str, Any]:
+        """
+        Classify text, batching it with other concurrent calls.
+        
+        Args:
+            text: Input text to classify
+            
+        Returns:
+            Classification result with label and confidence score
+        """
+        if self._batch_scheduler is None:
+            self._batch_scheduler = BatchScheduler(self.classify_batch)
+        return await self._batch_scheduler.submit(text)
+    
+    def _predict_probabilities(self, text: str) -> torch.Tensor:
+        """Run the model on a text and return its class probabilities as a 1-D tensor."""
+        # Tokenize input
+        inputs = self._tokenize_cached(text, 512)
+        
+        # Get model outputs
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+            return torch.softmax(outputs.logits, dim=-1)[0]
+    
     def get_probabilities(self, text: str) -> Dict[str, float]:
         """
         Get probability scores for all classes.
@@ -139,26 +313,28 @@ class TextClassifier:
         Returns:
             Dictionary mapping class labels to probabilities
         """
-        # Tokenize input
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=512
-        ).to(self.device)
+        probabilities = self._predict_probabilities(text)
         
-        # Get model outputs
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probabilities = torch.softmax(outputs.logits, dim=-1)
+        # Convert to dictionary with a single device-to-host copy
+        return dict(zip(self.labels, probabilities.float().cpu().tolist()))
+    
+    def predict(self, text: str) -> str:
+        """
+        Predict the most likely label for the given text.
         
-        # Convert to dictionary
-        prob_dict = {}
-        for i, label in enumerate(self.labels):
-            prob_dict[label] = probabilities[0][i].item()
+        Args:
+            text: Input text
+            
+        Returns:
+            Predicted class label
+        """
+        inputs = self._tokenize_cached(text, 512)
         
-        return prob_dict
+        # Argmax of the logits needs neither a softmax nor the full vector
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        
+        return self.labels[int(outputs.logits[0].argmax())]
     
     def get_top_k_predictions(self, text: str, k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -171,32 +347,71 @@ class TextClassifier:
         Returns:
             List of top-k predictions with labels and scores
         """
-        probabilities = self.get_probabilities(text)
+        probabilities = self._predict_probabilities(text)
         
-        # Sort by probability
-        sorted_probs = sorted(
-            probabilities.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
+        # Select the top-k on the device and copy only those k values back
+        values, indices = torch.topk(probabilities, k=min(k, probabilities.numel()))
         
         # Return top-k
         top_k = []
-        for label, prob in sorted_probs[:k]:
+        for index, prob in zip(indices.tolist(), values.tolist()):
             top_k.append({
-                "label": label,
+                "label": self.labels[index],
                 "score": prob
             })
         
         return top_k
     
-    def evaluate(self, texts: List[str], true_labels: List[str]) -> Dict[str, Any]:
+    def _get_replica_pipelines(self) -> list:
+        """Return one pipeline per visible GPU, replicating the model on first use."""
+        if self._replica_pipelines is None:
+            self._replica_pipelines = [self.pipeline]
+            state_dict = self.model.state_dict()
+            for device_index in range(1, torch.cuda.device_count()):
+                # Build each replica on the CPU so cuda:0 never holds a second copy
+                replica = AutoModelForSequenceClassification.from_config(
+                    self.model.config,
+                    torch_dtype=self.model.dtype
+                )
+                replica.load_state_dict(state_dict)
+                replica.to(f"cuda:{device_index}").eval()
+                
+                # Fast tokenizers are not thread-safe, so each replica gets its own
+                self._replica_pipelines.append(pipeline(
+                    "text-classification",
+                    model=replica,
+                    tokenizer=copy.deepcopy(self.tokenizer),
+                    device=device_index
+                ))
+            logger.info(f"Replicated {self.model_name} on {len(self._replica_pipelines)} GPUs")
+        
+        return self._replica_pipelines
+    
+    def _classify_multi_gpu(self, texts: List[str], batch_size: int) -> List[Dict[str, Any]]:
+        """Split texts into one contiguous shard per GPU and classify the shards in parallel."""
+        replicas = self._get_replica_pipelines()
+        shard_size = -(-len(texts) // len(replicas))
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            shard_results = executor.map(
+                lambda args: self._classify_buckets(args[0], args[1], batch_size),
+                zip(replicas, shards)
+            )
+        
+        return [result for results in shard_results for result in results]
+    
+    def evaluate(self, texts: List[str], true_labels: List[str], batch_size: int = 32) -> Dict[str, Any]:
         """
         Evaluate the classifier on a test set.
         
+        On a machine with several GPUs the texts are split across per-GPU
+        model replicas and classified in parallel.
+        
         Args:
             texts: List of test texts
             true_labels: List of true labels
+            batch_size: Number of texts per model forward pass
             
         Returns:
             Evaluation metrics
@@ -204,10 +419,63 @@ class TextClassifier:
         if len(texts) != len(true_labels):
             raise ValueError("Number of texts and labels must be equal")
         
-        # Get predictions
-        predictions = self.classify_batch(texts)
+        # Get predictions (the compiled forward is not replicated)
+        if self.device == "cuda" and torch.cuda.device_count() > 1 and not self.compile_model:
+            predictions = self._classify_multi_gpu(texts, batch_size)
+        else:
+            predictions = self.classify_batch(texts, batch_size=batch_size)
         pred_labels = [pred["label"] for pred in predictions]
         
+        return self._compute_metrics(pred_labels, list(true_labels))
+    
+    def evaluate_distributed(
+        self,
+        df,
+        text_col: str,
+        label_col: str,
+        batch_size: int = 32
+    ) -> Dict[str, Any]:
+        """
+        Evaluate the classifier on a Spark DataFrame.
+        
+        Predictions run in a pandas UDF on the executors; each task loads the
+        classifier from model_name once and classifies its partition in
+        batches. Executors need access to model_name (a hub name or a path
+        on shared storage).
+        
+        Args:
+            df: pyspark.sql.DataFrame with text and label columns
+            text_col: Name of the text column
+            label_col: Name of the true label column
+            batch_size: Number of texts per model forward pass
+            
+        Returns:
+            Evaluation metrics
+        """
+        import pandas as pd
+        from pyspark.sql.functions import pandas_udf
+        
+        classifier_class = type(self)
+        model_name = self.model_name
+        labels = self.labels
+        
+        @pandas_udf("string")
+        def predict_udf(batches: Iterator[pd.Series]) -> Iterator[pd.Series]:
+            # Load the model once per task rather than once per batch
+            classifier = classifier_class(model_name, labels=labels)
+            for texts in batches:
+                predictions = classifier.classify_batch(texts.tolist(), batch_size=batch_size)
+                yield pd.Series([pred["label"] for pred in predictions])
+        
+        results = df.select(
+            predict_udf(df[text_col]).alias("prediction"),
+            df[label_col].alias("label")
+        ).toPandas()
+        
+        return self._compute_metrics(results["prediction"].tolist(), results["label"].tolist())
+    
+    def _compute_metrics(self, pred_labels: List[str], true_labels: List[str]) -> Dict[str, Any]:
+        """Compute the evaluation metrics for predicted and true labels."""
         # Calculate metrics
         report = classification_report(
             true_labels,
@@ -220,7 +488,7 @@ class TextClassifier:
         cm = confusion_matrix(true_labels, pred_labels, labels=self.labels)
         
         # Calculate accuracy
-        accuracy = sum(1 for p, t in zip(pred_labels, true_labels) if p == t) / len(true_labels)
+        accuracy = float((np.asarray(pred_labels) == np.asarray(true_labels)).mean())
         
         return {
             "accuracy": accuracy,
@@ -256,7 +524,6 @@ class TextClassifier:
             learning_rate: Learning rate for training
             **kwargs: Additional training arguments
         """
-        from transformers import Trainer, TrainingArguments
         from datasets import Dataset
         
         # Create datasets
@@ -273,18 +540,66 @@ class TextClassifier:
         else:
             val_dataset = None
         
-        # Tokenize datasets
+        self._train(
+            train_dataset,
+            val_dataset,
+            output_dir=output_dir,
+            num_epochs=num_epochs,
+            batch_size=batch_size,
+            learning_rate=learning_rate,
+            **kwargs
+        )
+        
+        logger.info(f"Classifier fine-tuned and saved to {output_dir}")
+    
+    def _train(
+        self,
+        train_dataset,
+        val_dataset,
+        output_dir: str,
+        num_epochs: int,
+        batch_size: int,
+        learning_rate: float,
+        trainer_class=None,
+        **kwargs
+    ):
+        """
+        Tokenize the datasets, train the model with a Trainer and save it.
+        
+        Args:
+            train_dataset: Training dataset with a "text" column
+            val_dataset: Optional validation dataset
+            output_dir: Directory to save the trained model
+            num_epochs: Number of training epochs
+            batch_size: Training batch size
+            learning_rate: Learning rate for training
+            trainer_class: Trainer subclass to use (defaults to Trainer)
+            **kwargs: Additional training arguments
+        """
+        from transformers import Trainer, TrainingArguments, DataCollatorWithPadding
+        
+        trainer_class = trainer_class or Trainer
+        
+        # Tokenize datasets without padding; the collator pads each batch to
+        # its own longest sequence instead of every sample to 512
         def tokenize_function(examples):
-            return self.tokenizer(
+            tokens = self.tokenizer(
                 examples["text"],
-                padding="max_length",
                 truncation=True,
                 max_length=512
             )
+            tokens["length"] = [len(ids) for ids in tokens["input_ids"]]
+            return tokens
         
-        train_dataset = train_dataset.map(tokenize_function, batched=True)
+        train_dataset = train_dataset.map(tokenize_function, batched=True, remove_columns=["text"])
         if val_dataset:
-            val_dataset = val_dataset.map(tokenize_function, batched=True)
+            val_dataset = val_dataset.map(tokenize_function, batched=True, remove_columns=["text"])
+        
+        # Pad to multiples of 8 so batch shapes map well onto tensor cores
+        data_collator = DataCollatorWithPadding(tokenizer=self.tokenizer, pad_to_multiple_of=8)
+        
+        use_cuda = torch.cuda.is_available()
+        use_bf16 = use_cuda and torch.cuda.is_bf16_supported()
         
         # Training arguments
         training_args = TrainingArguments(
@@ -296,16 +611,24 @@ class TextClassifier:
             save_steps=500,
             save_total_limit=2,
             evaluation_strategy="epoch" if val_dataset else "no",
+            bf16=kwargs.pop("bf16", use_bf16),
+            fp16=kwargs.pop("fp16", use_cuda and not use_bf16),
+            gradient_accumulation_steps=kwargs.pop("gradient_accumulation_steps", 1),
+            dataloader_num_workers=kwargs.pop("dataloader_num_workers", 4),
+            dataloader_pin_memory=kwargs.pop("dataloader_pin_memory", use_cuda),
+            group_by_length=kwargs.pop("group_by_length", True),
+            length_column_name="length",
             **kwargs
         )
         
         # Create trainer
-        trainer = Trainer(
+        trainer = trainer_class(
             model=self.model,
             args=training_args,
             train_dataset=train_dataset,
             eval_dataset=val_dataset,
-            tokenizer=self.tokenizer
+            tokenizer=self.tokenizer,
+            data_collator=data_collator
         )
         
         # Train
@@ -318,8 +641,119 @@ class TextClassifier:
         # Save labels
         with open(os.path.join(output_dir, "labels.json"), "w") as f:
             json.dump(self.labels, f)
+    
+    @classmethod
+    def from_distilled(
+        cls,
+        teacher_path: str,
+        student_name: str,
+        train_texts: List[str],
+        output_dir: str = "./distilled_classifier",
+        temperature: float = 2.0,
+        num_epochs: int = 3,
+        batch_size: int = 16,
+        learning_rate: float = 5e-5,
+        device: Optional[str] = None,
+        int8: bool = True,
+        **kwargs
+    ) -> "TextClassifier":
+        """
+        Distill a classifier into a smaller student model.
         
-        logger.info(f"Classifier fine-tuned and saved to {output_dir}")
+        The student is trained to match the teacher's temperature-softened
+        class distribution on unlabeled texts, saved to output_dir and
+        reloaded (INT8-quantized when running on CPU).
+        
+        Args:
+            teacher_path: Name or path of the fine-tuned teacher classifier
+            student_name: Name or path of the student model, e.g.
+                "distilbert-base-uncased"
+            train_texts: Texts to distill on
+            output_dir: Directory to save the student model
+            temperature: Softmax temperature for the distillation loss
+            num_epochs: Number of training epochs
+            batch_size: Training batch size
+            learning_rate: Learning rate for training
+            device: Device to run the models on
+            int8: Whether to quantize the returned student to INT8 on CPU
+            **kwargs: Additional training arguments
+            
+        Returns:
+            The distilled classifier
+        """
+        from transformers import Trainer
+        from datasets import Dataset
+        
+        teacher = cls.load(teacher_path, device=device)
+        labels = teacher.labels
+        
+        # Score the texts with the teacher once, using its own tokenizer
+        def add_teacher_logits(examples):
+            inputs = teacher.tokenizer(
+                examples["text"],
+                return_tensors="pt",
+                padding=True,
+                truncation=True,
+                max_length=512
+            ).to(teacher.device)
+            
+            with torch.inference_mode():
+                logits = teacher.model(**inputs).logits
+            
+            return {"teacher_logits": logits.float().cpu().tolist()}
+        
+        train_dataset = Dataset.from_dict({"text": train_texts}).map(
+            add_teacher_logits,
+            batched=True,
+            batch_size=batch_size
+        )
+        
+        # Free the teacher before training the student
+        del teacher
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        
+        student = cls(
+            student_name,
+            labels=labels,
+            device=device,
+            num_labels=len(labels),
+            id2label=dict(enumerate(labels)),
+            label2id={label: i for i, label in enumerate(labels)}
+        )
+        
+        class DistillationTrainer(Trainer):
+            """Trainer with a KL divergence loss against the teacher logits."""
+            
+            def compute_loss(self, model, inputs, return_outputs=False, **loss_kwargs):
+                teacher_logits = inputs.pop("teacher_logits")
+                inputs.pop("length", None)
+                outputs = model(**inputs)
+                
+                # Soft-target loss, scaled by T^2 to keep gradient magnitudes
+                loss = F.kl_div(
+                    F.log_softmax(outputs.logits / temperature, dim=-1),
+                    F.softmax(teacher_logits / temperature, dim=-1),
+                    reduction="batchmean"
+                ) * temperature ** 2
+                
+                return (loss, outputs) if return_outputs else loss
+        
+        student._train(
+            train_dataset,
+            None,
+            output_dir=output_dir,
+            num_epochs=num_epochs,
+            batch_size=batch_size,
+            learning_rate=learning_rate,
+            trainer_class=DistillationTrainer,
+            remove_unused_columns=False,
+            **kwargs
+        )
+        
+        logger.info(f"Distilled {teacher_path} into {student_name} at {output_dir}")
+        
+        return cls(output_dir, labels=labels, device=student.device, int8=int8)
     
     def save(self, path: str):
         """Save the classifier to the specified path."""
@@ -374,5 +808,6 @@ class TextClassifier:
             "labels": self.labels,
             "num_classes": len(self.labels),
             "device": self.device,
-            "num_parameters": sum(p.numel() for p in self.model.parameters())
+            "backend": "onnxruntime-int8" if self.onnx_int8 else ("pytorch-int8" if self.int8 else "pytorch"),
+            "num_parameters": self._num_parameters
         }
\ No newline at end of file
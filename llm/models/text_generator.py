@@ -10,19 +10,37 @@ from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     pipeline,
-    GenerationConfig
+    GenerationConfig,
+    TextIteratorStreamer
 )
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Union, Tuple
+from threading import Lock, Thread
 import logging
 import json
 import os
-from dataclasses import dataclass
+import importlib.util
+from functools import lru_cache
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, astuple, replace
+
+from ..utils.batching import BatchScheduler
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_BACKENDS = ("pytorch", "onnx", "openvino", "vllm")
+
+# Distinct generation settings that keep a batch scheduler alive
+MAX_BATCH_SCHEDULERS = 16
+
+# Distinct generation settings whose GenerationConfig is kept
+MAX_GENERATION_CONFIGS = 64
+
+# Seconds stream_generate waits for the next token before giving up
+STREAM_TIMEOUT = 60.0
+
 @dataclass
-class GenerationConfig:
-    """Configuration for text generation."""
+class GenSpec:
+    """Generation settings, converted to a transformers GenerationConfig per model."""
     max_length: int = 100
     min_length: int = 10
     temperature: float = 0.7
@@ -54,6 +72,9 @@ class TextGenerator:
         model_name: str,
         device: Optional[str] = None,
         cache_dir: Optional[str] = None,
+        compile_model: bool = False,
+        prefix_cache_size: int = 8,
+        backend: str = "pytorch",
         **kwargs
     ):
         """
@@ -63,11 +84,30 @@ class TextGenerator:
             model_name: Name or path of the pre-trained model
             device: Device to run the model on
             cache_dir: Directory to cache model files
+            compile_model: Whether to compile the model forward with torch.compile
+            prefix_cache_size: Number of prompt-template prefixes whose key/value
+                cache is kept for reuse
+            backend: Inference backend ("pytorch", "onnx", "openvino" or "vllm");
+                exported engines are cached under cache_dir/engines, and vllm
+                serves the model with continuous batching and prefix caching
             **kwargs: Additional arguments for model initialization
         """
+        if backend not in SUPPORTED_BACKENDS:
+            raise ValueError(f"Unsupported backend: {backend}. Choose from {SUPPORTED_BACKENDS}")
+        
         self.model_name = model_name
+        self.backend = backend
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.cache_dir = cache_dir
+        self.compile_model = compile_model
+        self._batch_schedulers = OrderedDict()
+        self._generation_configs = OrderedDict()
+        self._generation_configs_lock = Lock()
+        self.prefix_cache_size = prefix_cache_size
+        self._prefix_cache = OrderedDict()
+        
+        # Per-instance LRU of device tensors for repeated prompts
+        self._tokenize_cached = lru_cache(maxsize=1024)(self._tokenize)
         
         logger.info(f"Initializing text generator: {model_name} on {self.device}")
         
@@ -88,17 +128,41 @@ class TextGenerator:
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
+            # Decoder-only models continue from the last position, so batched
+            # prompts must be padded on the left
+            self.tokenizer.padding_side = "left"
+            
+            # vLLM owns the weights and its own scheduler; no pipeline needed
+            self._num_parameters = None
+            if self.backend == "vllm":
+                self.model = None
+                self.pipeline = None
+                self.engine = self._load_vllm_engine()
+                logger.info(f"Text generator {self.model_name} loaded successfully")
+                return
+            
             # Load model
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                cache_dir=self.cache_dir,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                **kwargs
-            )
+            if self.backend == "pytorch":
+                self.model = self._load_model(**kwargs)
+                
+                # Move model to device
+                self.model.to(self.device)
+                self.model.eval()
+                
+                self._num_parameters = sum(p.numel() for p in self.model.parameters())
+            else:
+                self.model = self._load_exported_model(**kwargs)
             
-            # Move model to device
-            self.model.to(self.device)
-            self.model.eval()
+            # Compile the forward in place (before the pipeline is built) so the
+            # pipeline, generate() and direct calls all go through it
+            if self.compile_model and self.backend == "pytorch":
+                self.model.forward = torch.compile(
+                    self.model.forward,
+                    mode="reduce-overhead",
+                    fullgraph=False,
+                    dynamic=True
+                )
+                self._warmup_model()
             
             # Create pipeline
             self.pipeline = pipeline(
@@ -114,10 +178,184 @@ class TextGenerator:
             logger.error(f"Error loading text generator {self.model_name}: {str(e)}")
             raise
     
+    def _load_model(self, **kwargs):
+        """Load the causal LM, using BF16 and FlashAttention-2 on CUDA when possible."""
+        if self.device == "cuda":
+            # BF16 keeps the FP32 exponent range, so softmax accumulators
+            # cannot overflow the way they can in FP16
+            torch_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        else:
+            torch_dtype = torch.float32
+        
+        if self.device == "cuda" and importlib.util.find_spec("flash_attn") is not None:
+            try:
+                return AutoModelForCausalLM.from_pretrained(
+                    self.model_name,
+                    cache_dir=self.cache_dir,
+                    torch_dtype=torch_dtype,
+                    attn_implementation="flash_attention_2",
+                    **kwargs
+                )
+            except (ValueError, ImportError) as e:
+                logger.warning(f"FlashAttention-2 unavailable for {self.model_name}, using default attention: {str(e)}")
+        
+        return AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            cache_dir=self.cache_dir,
+            torch_dtype=torch_dtype,
+            **kwargs
+        )
+    
+    def _tokenize(self, prompt: str):
+        """
+        Tokenize a prompt and move it to the model device.
+        
+        Results are shared through _tokenize_cached, so callers must not
+        modify the returned tensors in place. A single prompt needs no
+        padding; batched callers pad themselves.
+        """
+        return self.tokenizer(
+            prompt,
+            return_tensors="pt",
+            add_special_tokens=True,
+            truncation=True
+        ).to(self.device)
+    
+    def _load_exported_model(self, **kwargs):
+        """Load an ONNX Runtime or OpenVINO model, exporting it once into the engine cache."""
+        engine_dir = os.path.join(
+            self.cache_dir or ".",
+            "engines",
+            self.backend,
+            self.model_name.replace("/", "--")
+        )
+        
+        if self.backend == "onnx":
+            from optimum.onnxruntime import ORTModelForCausalLM as model_class
+            
+            # IO binding keeps inputs and the KV cache on the GPU between steps
+            load_kwargs = {
+                "provider": "CUDAExecutionProvider" if self.device == "cuda" else "CPUExecutionProvider",
+                "use_io_binding": self.device == "cuda"
+            }
+        else:
+            from optimum.intel import OVModelForCausalLM as model_class
+            load_kwargs = {}
+        
+        if os.path.isdir(engine_dir):
+            return model_class.from_pretrained(engine_dir, **load_kwargs)
+        
+        model = model_class.from_pretrained(
+            self.model_name,
+            export=True,
+            cache_dir=self.cache_dir,
+            **load_kwargs,
+            **kwargs
+        )
+        model.save_pretrained(engine_dir)
+        logger.info(f"Exported {self.model_name} for {self.backend} to {engine_dir}")
+        
+        return model
+    
+    def _load_vllm_engine(self):
+        """Start a vLLM engine (PagedAttention, continuous batching, prefix caching)."""
+        from vllm import LLM
+        
+        return LLM(
+            model=self.model_name,
+            dtype="bfloat16" if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else "float16",
+            download_dir=self.cache_dir,
+            gpu_memory_utilization=0.9,
+            enable_prefix_caching=True
+        )
+    
+    def _vllm_generate(self, prompts: List[str], config: GenSpec, n: int = 1) -> List[List[str]]:
+        """
+        Generate with the vLLM engine.
+        
+        Args:
+            prompts: Input text prompts
+            config: Generation configuration; max_length counts the prompt
+                tokens, as with transformers
+            n: Number of sequences per prompt
+            
+        Returns:
+            For each prompt, its n generated texts (prompt included)
+        """
+        from vllm import SamplingParams
+        
+        prompt_lengths = [len(ids) for ids in self.tokenizer(prompts)["input_ids"]]
+        
+        # One SamplingParams per prompt, since the token budget depends on its length
+        sampling_params = [
+            SamplingParams(
+                n=n,
+                temperature=config.temperature if config.do_sample else 0.0,
+                top_p=config.top_p if config.do_sample else 1.0,
+                top_k=config.top_k if config.do_sample and config.top_k > 0 else -1,
+                repetition_penalty=config.repetition_penalty,
+                max_tokens=max(config.max_length - length, 1)
+            )
+            for length in prompt_lengths
+        ]
+        
+        outputs = self.engine.generate(prompts, sampling_params, use_tqdm=False)
+        
+        return [
+            [prompt + completion.text for completion in output.outputs]
+            for prompt, output in zip(prompts, outputs)
+        ]
+    
+    def _warmup_model(self):
+        """Run one forward pass so the compile cost is paid at load time."""
+        inputs = self.tokenizer(
+            "Warmup input for model compilation.",
+            return_tensors="pt",
+            truncation=True
+        ).to(self.device)
+        
+        with torch.inference_mode():
+            self.model(**inputs)
+        
+        logger.info(f"Compiled and warmed up {self.model_name}")
+    
+    def _get_generation_config(self, config: GenSpec) -> GenerationConfig:
+        """
+        Return the transformers GenerationConfig for a spec, built once per distinct spec.
+        
+        Args:
+            config: Generation settings
+            
+        Returns:
+            Cached GenerationConfig with the tokenizer's pad and EOS tokens filled in
+        """
+        key = astuple(config)
+        
+        # Called from executor threads, so the LRU updates are locked
+        with self._generation_configs_lock:
+            generation_config = self._generation_configs.get(key)
+            if generation_config is not None:
+                self._generation_configs.move_to_end(key)
+                return generation_config
+        
+        settings = asdict(config)
+        if settings["pad_token_id"] is None:
+            settings["pad_token_id"] = self.tokenizer.pad_token_id
+        if settings["eos_token_id"] is None:
+            settings["eos_token_id"] = self.tokenizer.eos_token_id
+        generation_config = GenerationConfig(use_cache=True, **settings)
+        
+        with self._generation_configs_lock:
+            self._generation_configs[key] = generation_config
+            if len(self._generation_configs) > MAX_GENERATION_CONFIGS:
+                self._generation_configs.popitem(last=False)
+        
+        return generation_config
+    
     def generate(
         self,
         prompt: str,
-        config: Optional[GenerationConfig] = None,
+        config: Optional[GenSpec] = None,
         **kwargs
     ) -> str:
         """
@@ -131,51 +369,20 @@ class TextGenerator:
         Returns:
             Generated text
         """
-        config = config or GenerationConfig()
-        
-        # Prepare generation config
-        generation_config = GenerationConfig(
-            max_length=config.max_length,
-            min_length=config.min_length,
-            temperature=config.temperature,
-            top_p=config.top_p,
-            top_k=config.top_k,
-            do_sample=config.do_sample,
-            num_return_sequences=config.num_return_sequences,
-            repetition_penalty=config.repetition_penalty,
-            length_penalty=config.length_penalty,
-            no_repeat_ngram_size=config.no_repeat_ngram_size,
-            early_stopping=config.early_stopping,
-            pad_token_id=self.tokenizer.pad_token_id,
-            eos_token_id=self.tokenizer.eos_token_id,
-            **kwargs
-        )
+        if self.backend == "vllm":
+            return self._vllm_generate([prompt], config or GenSpec())[0][0]
+        
+        generation_config = self._get_generation_config(config or GenSpec())
         
         # Tokenize input
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            padding=True,
-            truncation=True
-        ).to(self.device)
+        inputs = self._tokenize_cached(prompt)
         
-        # Generate
-        with torch.no_grad():
+        # Generate; extra kwargs override the cached config for this call only
+        with torch.inference_mode():
             outputs = self.model.generate(
                 **inputs,
-                max_length=generation_config.max_length,
-                min_length=generation_config.min_length,
-                temperature=generation_config.temperature,
-                top_p=generation_config.top_p,
-                top_k=generation_config.top_k,
-                do_sample=generation_config.do_sample,
-                num_return_sequences=generation_config.num_return_sequences,
-                repetition_penalty=generation_config.repetition_penalty,
-                length_penalty=generation_config.length_penalty,
-                no_repeat_ngram_size=generation_config.no_repeat_ngram_size,
-                early_stopping=generation_config.early_stopping,
-                pad_token_id=generation_config.pad_token_id,
-                eos_token_id=generation_config.eos_token_id
+                generation_config=generation_config,
+                **kwargs
             )
         
         # Decode output
@@ -186,6 +393,195 @@ class TextGenerator:
         
         return generated_text
     
+    def generate_batch(
+        self,
+        prompts: List[str],
+        config: Optional[GenSpec] = None
+    ) -> List[str]:
+        """
+        Generate one continuation for each prompt, batching prompts of equal token length.
+        
+        max_length and min_length count the prompt, so padding would eat
+        into a shorter prompt's budget; grouping by length keeps every
+        prompt unpadded and its output the same as with generate().
+        
+        Args:
+            prompts: Input text prompts
+            config: Generation configuration shared by all prompts
+            
+        Returns:
+            Generated texts, in the order of the prompts
+        """
+        if self.backend == "vllm":
+            return [texts[0] for texts in self._vllm_generate(prompts, config or GenSpec())]
+        
+        generation_config = self._get_generation_config(
+            replace(config or GenSpec(), num_return_sequences=1)
+        )
+        
+        # Tokenize inputs and group them by length
+        encoded = self.tokenizer(prompts, truncation=True)["input_ids"]
+        groups = {}
+        for index, token_ids in enumerate(encoded):
+            groups.setdefault(len(token_ids), []).append(index)
+        
+        results = [None] * len(prompts)
+        for indices in groups.values():
+            input_ids = torch.tensor([encoded[index] for index in indices], device=self.device)
+            
+            # Generate
+            with torch.inference_mode():
+                outputs = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    generation_config=generation_config
+                )
+            
+            for index, text in zip(indices, self.tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                results[index] = text
+        
+        return results
+    
+    async def generate_async(
+        self,
+        prompt: str,
+        config: Optional[GenSpec] = None
+    ) -> str:
+        """
+        Generate text, batching the prompt with concurrent calls that use the same config.
+        
+        Args:
+            prompt: Input text prompt
+            config: Generation configuration
+            
+        Returns:
+            Generated text
+        """
+        config = config or GenSpec()
+        key = astuple(config)
+        
+        if key in self._batch_schedulers:
+            self._batch_schedulers.move_to_end(key)
+        else:
+            self._batch_schedulers[key] = BatchScheduler(
+                lambda prompts: self.generate_batch(prompts, config)
+            )
+            if len(self._batch_schedulers) > MAX_BATCH_SCHEDULERS:
+                _, evicted = self._batch_schedulers.popitem(last=False)
+                evicted.close()
+        return await self._batch_schedulers[key].submit(prompt)
+    
+    def _prefill(self, prompt: str) -> Tuple[torch.Tensor, torch.Tensor, Optional[Any]]:
+        """
+        Run a prompt through the model once and return its key/value cache.
+        
+        The last prompt token is left out of the prefill so generate() still
+        has one uncached token to feed on its first step.
+        
+        Args:
+            prompt: Input text prompt
+            
+        Returns:
+            Tuple of (input_ids, attention_mask, past_key_values); past_key_values
+            is None for single-token prompts
+        """
+        inputs = self._tokenize_cached(prompt)
+        input_ids, attention_mask = inputs.input_ids, inputs.attention_mask
+        
+        if input_ids.shape[1] < 2:
+            return input_ids, attention_mask, None
+        
+        with torch.inference_mode():
+            past_key_values = self.model(
+                input_ids=input_ids[:, :-1],
+                attention_mask=attention_mask[:, :-1],
+                use_cache=True
+            ).past_key_values
+        
+        return input_ids, attention_mask, past_key_values
+    
+    @staticmethod
+    def _repeat_past_key_values(past_key_values, repeats: int):
+        """Repeat each cached key/value along the batch dimension."""
+        if hasattr(past_key_values, "batch_repeat_interleave"):
+            # Cache objects (DynamicCache) are expanded in place
+            past_key_values.batch_repeat_interleave(repeats)
+            return past_key_values
+        
+        return tuple(
+            tuple(tensor.repeat_interleave(repeats, dim=0) for tensor in layer)
+            for layer in past_key_values
+        )
+    
+    def _get_prefix_cache(self, prefix: str):
+        """Return the token IDs and key/value cache for a prompt prefix (LRU)."""
+        if prefix in self._prefix_cache:
+            self._prefix_cache.move_to_end(prefix)
+            return self._prefix_cache[prefix]
+        
+        prefix_ids = self.tokenizer(prefix, return_tensors="pt").input_ids.to(self.device)
+        with torch.inference_mode():
+            past_key_values = self.model(input_ids=prefix_ids, use_cache=True).past_key_values
+        
+        # Store plain tensors: generate() grows Cache objects in place, which
+        # would leak one call's tokens into the next
+        if hasattr(past_key_values, "to_legacy_cache"):
+            past_key_values = past_key_values.to_legacy_cache()
+        
+        self._prefix_cache[prefix] = (prefix_ids, past_key_values)
+        if len(self._prefix_cache) > self.prefix_cache_size:
+            self._prefix_cache.popitem(last=False)
+        
+        return prefix_ids, past_key_values
+    
+    def generate_from_prefix(
+        self,
+        prefix: str,
+        suffix: str,
+        config: Optional[GenSpec] = None
+    ) -> str:
+        """
+        Generate text for prefix + suffix, reusing the cached prefill of the prefix.
+        
+        The prefix is tokenized and run through the model once; later calls
+        with the same prefix only prefill the suffix tokens.
+        
+        Args:
+            prefix: Static prompt-template prefix
+            suffix: Remainder of the prompt
+            config: Generation configuration
+            
+        Returns:
+            Generated text
+        """
+        if self.backend == "vllm":
+            # vLLM's own prefix caching reuses the shared prefix blocks
+            return self.generate(prefix + suffix, config)
+        
+        generation_config = self._get_generation_config(
+            replace(config or GenSpec(), num_return_sequences=1)
+        )
+        prefix_ids, past_key_values = self._get_prefix_cache(prefix)
+        
+        suffix_ids = self.tokenizer(
+            suffix,
+            return_tensors="pt",
+            add_special_tokens=False
+        ).input_ids.to(self.device)
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1)
+        
+        # generate() only feeds the tokens not covered by past_key_values; the
+        # cached tensors are concatenated onto, never modified in place
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                generation_config=generation_config
+            )
+        
+        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+    
     def generate_story(
         self,
         title: str,
@@ -205,16 +601,19 @@ class TextGenerator:
         Returns:
             Generated story
         """
-        prompt = f"Title: {title}\nGenre: {genre}\n\nOnce upon a time,"
+        prefix = "Title:"
+        prompt = f"{prefix} {title}\nGenre: {genre}\n\nOnce upon a time,"
         
-        config = GenerationConfig(
+        config = GenSpec(
             max_length=max_length,
             temperature=0.8,
             top_p=0.9,
             repetition_penalty=1.1
         )
         
-        return self.generate(prompt, config, **kwargs)
+        if kwargs:
+            return self.generate(prompt, config, **kwargs)
+        return self.generate_from_prefix(prefix, prompt[len(prefix):], config)
     
     def generate_poetry(
         self,
@@ -235,16 +634,19 @@ class TextGenerator:
         Returns:
             Generated poem
         """
-        prompt = f"Theme: {theme}\nStyle: {style}\n\n"
+        prefix = "Theme:"
+        prompt = f"{prefix} {theme}\nStyle: {style}\n\n"
         
-        config = GenerationConfig(
+        config = GenSpec(
             max_length=max_length,
             temperature=0.9,
             top_p=0.95,
             repetition_penalty=1.2
         )
         
-        return self.generate(prompt, config, **kwargs)
+        if kwargs:
+            return self.generate(prompt, config, **kwargs)
+        return self.generate_from_prefix(prefix, prompt[len(prefix):], config)
     
     def generate_dialogue(
         self,
@@ -267,16 +669,19 @@ class TextGenerator:
         Returns:
             Generated dialogue
         """
-        prompt = f"Context: {context}\n\n{character1}: "
+        prefix = "Context:"
+        prompt = f"{prefix} {context}\n\n{character1}: "
         
-        config = GenerationConfig(
+        config = GenSpec(
             max_length=max_length,
             temperature=0.7,
             top_p=0.9,
             repetition_penalty=1.1
         )
         
-        return self.generate(prompt, config, **kwargs)
+        if kwargs:
+            return self.generate(prompt, config, **kwargs)
+        return self.generate_from_prefix(prefix, prompt[len(prefix):], config)
     
     def complete_text(
         self,
@@ -295,7 +700,7 @@ class TextGenerator:
         Returns:
             Completed text
         """
-        config = GenerationConfig(
+        config = GenSpec(
             max_length=max_length,
             temperature=0.6,
             top_p=0.9
@@ -307,7 +712,7 @@ class TextGenerator:
         self,
         prompt: str,
         num_sequences: int = 3,
-        config: Optional[GenerationConfig] = None,
+        config: Optional[GenSpec] = None,
         **kwargs
     ) -> List[str]:
         """
@@ -322,34 +727,39 @@ class TextGenerator:
         Returns:
             List of generated texts
         """
-        config = config or GenerationConfig()
-        config.num_return_sequences = num_sequences
-        
-        # Tokenize input
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            padding=True,
-            truncation=True
-        ).to(self.device)
+        # Copy rather than mutate the caller's spec; the cached config sets
+        # use_cache=True even if the checkpoint config disabled the cache
+        # (common after gradient-checkpointed fine-tuning)
+        spec = config or GenSpec()
+        
+        if self.backend == "vllm":
+            return self._vllm_generate([prompt], spec, n=num_sequences)[0]
+        
+        if self.backend == "pytorch" and num_sequences > 1:
+            # Prefill the prompt once and share its cache across the sequences,
+            # instead of letting generate() prefill num_sequences copies of it
+            input_ids, attention_mask, past_key_values = self._prefill(prompt)
+            inputs = {
+                "input_ids": input_ids.repeat_interleave(num_sequences, dim=0),
+                "attention_mask": attention_mask.repeat_interleave(num_sequences, dim=0)
+            }
+            if past_key_values is not None:
+                inputs["past_key_values"] = self._repeat_past_key_values(past_key_values, num_sequences)
+            
+            generation_config = self._get_generation_config(
+                replace(spec, num_return_sequences=1)
+            )
+        else:
+            inputs = self._tokenize_cached(prompt)
+            generation_config = self._get_generation_config(
+                replace(spec, num_return_sequences=num_sequences)
+            )
         
         # Generate
-        with torch.no_grad():
+        with torch.inference_mode():
             outputs = self.model.generate(
                 **inputs,
-                max_length=config.max_length,
-                min_length=config.min_length,
-                temperature=config.temperature,
-                top_p=config.top_p,
-                top_k=config.top_k,
-                do_sample=config.do_sample,
-                num_return_sequences=config.num_return_sequences,
-                repetition_penalty=config.repetition_penalty,
-                length_penalty=config.length_penalty,
-                no_repeat_ngram_size=config.no_repeat_ngram_size,
-                early_stopping=config.early_stopping,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
+                generation_config=generation_config,
                 **kwargs
             )
         
@@ -364,7 +774,7 @@ class TextGenerator:
     def stream_generate(
         self,
         prompt: str,
-        config: Optional[GenerationConfig] = None,
+        config: Optional[GenSpec] = None,
         **kwargs
     ):
         """
@@ -377,46 +787,66 @@ class TextGenerator:
             
         Yields:
             Generated tokens
+            
+        Raises:
+            Exception: Whatever generation raised in the worker thread
+            queue.Empty: If no token arrives within STREAM_TIMEOUT seconds
         """
-        config = config or GenerationConfig()
+        if self.backend == "vllm":
+            # The offline vLLM engine returns whole completions
+            yield self._vllm_generate([prompt], config or GenSpec())[0][0][len(prompt):]
+            return
+        
+        # Decode incrementally from the KV cache (use_cache=True in the config)
+        generation_config = self._get_generation_config(config or GenSpec())
         
         # Tokenize input
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            padding=True,
-            truncation=True
-        ).to(self.device)
+        inputs = self._tokenize_cached(prompt)
         
-        # Generate with streaming
-        with torch.no_grad():
-            for outputs in self.model.generate(
-                **inputs,
-                max_length=config.max_length,
-                min_length=config.min_length,
-                temperature=config.temperature,
-                top_p=config.top_p,
-                top_k=config.top_k,
-                do_sample=config.do_sample,
-                repetition_penalty=config.repetition_penalty,
-                length_penalty=config.length_penalty,
-                no_repeat_ngram_size=config.no_repeat_ngram_size,
-                early_stopping=config.early_stopping,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-                return_dict_in_generate=True,
-                output_scores=True,
-                **kwargs
-            ):
-                # Decode the latest token
-                if hasattr(outputs, 'sequences'):
-                    latest_token = outputs.sequences[0][-1:]
-                    token_text = self.tokenizer.decode(latest_token, skip_special_tokens=True)
-                    if token_text:
-                        yield token_text
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            timeout=STREAM_TIMEOUT
+        )
+        
+        # Run generation in a background thread; the streamer hands decoded
+        # text back as soon as each token is produced
+        generation_kwargs = dict(
+            **inputs,
+            generation_config=generation_config,
+            streamer=streamer,
+            **kwargs
+        )
+        errors = []
+        
+        def run_generation():
+            # Inference mode is thread-local, so enter it inside the worker thread
+            try:
+                with torch.inference_mode():
+                    self.model.generate(**generation_kwargs)
+            except Exception as e:
+                logger.error(f"Error in streamed generation: {str(e)}")
+                errors.append(e)
+                # Unblock the consumer, which re-raises below
+                streamer.end()
+        
+        thread = Thread(target=run_generation, daemon=True)
+        thread.start()
+        
+        for token_text in streamer:
+            if token_text:
+                yield token_text
+        
+        thread.join()
+        if errors:
+            raise errors[0]
     
     def save(self, path: str):
         """Save the text generator to the specified path."""
+        if self.backend == "vllm":
+            raise ValueError("Saving is not supported for the vllm backend; save the original checkpoint instead")
+        
         os.makedirs(path, exist_ok=True)
         self.model.save_pretrained(path)
         self.tokenizer.save_pretrained(path)
@@ -453,6 +883,7 @@ class TextGenerator:
         return {
             "model_name": self.model_name,
             "device": self.device,
-            "num_parameters": sum(p.numel() for p in self.model.parameters()),
+            "backend": self.backend,
+            "num_parameters": self._num_parameters,
             "vocab_size": self.tokenizer.vocab_size
         }
\ No newline at end of file
@@ -14,17 +14,22 @@ from transformers import (
     AutoModelForTokenClassification,
     AutoModelForQuestionAnswering,
     AutoModelForSeq2SeqLM,
-    pipeline,
+    BitsAndBytesConfig,
     GenerationConfig
 )
 from typing import Dict, List, Optional, Union, Any
 import logging
-import json
 import os
+import importlib.util
 from dataclasses import dataclass
 
+from ..utils.config import load_json, save_json
+from ..utils.helpers import get_model_size, has_safetensors_weights
+
 logger = logging.getLogger(__name__)
 
+SUPPORTED_QUANTIZATION = ("bf16", "int8", "nf4")
+
 @dataclass
 class GenerationParams:
     """Parameters for text generation."""
@@ -57,6 +62,8 @@ class TransformerModel:
         task: str = "text-generation",
         device: Optional[str] = None,
         cache_dir: Optional[str] = None,
+        compile_model: bool = False,
+        quantization: str = "bf16",
         **kwargs
     ):
         """
@@ -67,12 +74,36 @@ class TransformerModel:
             task: NLP task type ('text-generation', 'classification', 'ner', 'qa', 'summarization')
             device: Device to run the model on ('cpu', 'cuda', 'mps')
             cache_dir: Directory to cache model files
+            compile_model: Whether to compile the causal LM forward with
+                torch.compile (CUDA text generation only). Off by default:
+                the key/value cache grows every step, so the compiled graph
+                must stay shape-dynamic and the compile cost only pays off
+                for long-running generation workloads
+            quantization: Weight format of the causal LM on CUDA: "bf16"
+                (FP16 before Ampere), or bitsandbytes weight-only "int8" or
+                "nf4". Decoding is memory-bandwidth bound, since every step
+                reads all weights, so "nf4" moves ~4x fewer bytes than FP16
+                per token; "int8" is usually slower than "bf16" for inference
             **kwargs: Additional arguments for model initialization
         """
+        if quantization not in SUPPORTED_QUANTIZATION:
+            raise ValueError(f"Unsupported quantization: {quantization}. Choose from {SUPPORTED_QUANTIZATION}")
+        
         self.model_name = model_name
         self.task = task
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.cache_dir = cache_dir
+        self.quantization = quantization
+        
+        # bitsandbytes kernels are CUDA-only, and quantized modules do not
+        # support torch.compile
+        self.weight_quantized = self.quantization != "bf16" and self.task == "text-generation" and self.device == "cuda"
+        self.compile_model = (
+            compile_model
+            and self.task == "text-generation"
+            and self.device == "cuda"
+            and not self.weight_quantized
+        )
         
         logger.info(f"Initializing {task} model: {model_name} on {self.device}")
         
@@ -82,63 +113,66 @@ class TransformerModel:
     def _initialize_model(self, **kwargs):
         """Initialize the model and tokenizer based on the task."""
         try:
-            # Load tokenizer
+            # Load tokenizer (use_safetensors only applies to the weights)
+            tokenizer_kwargs = {name: value for name, value in kwargs.items() if name != "use_safetensors"}
             self.tokenizer = AutoTokenizer.from_pretrained(
                 self.model_name,
                 cache_dir=self.cache_dir,
-                **kwargs
+                **tokenizer_kwargs
             )
             
             # Add padding token if not present
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
+            # Load weights straight onto the GPU instead of into host memory first
+            model_kwargs = {**self._placement_kwargs(), **kwargs}
+            
             # Load model based on task
             if self.task == "text-generation":
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_name,
-                    cache_dir=self.cache_dir,
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    **kwargs
+                self.model = self._load_pretrained(
+                    AutoModelForCausalLM,
+                    **self._causal_lm_load_kwargs(),
+                    **model_kwargs
                 )
             elif self.task == "classification":
                 self.model = AutoModelForSequenceClassification.from_pretrained(
                     self.model_name,
                     cache_dir=self.cache_dir,
-                    **kwargs
+                    **model_kwargs
                 )
             elif self.task == "ner":
                 self.model = AutoModelForTokenClassification.from_pretrained(
                     self.model_name,
                     cache_dir=self.cache_dir,
-                    **kwargs
+                    **model_kwargs
                 )
             elif self.task == "qa":
-                self.model = AutoModelForQuestionAnswering.from_pretrained(
-                    self.model_name,
-                    cache_dir=self.cache_dir,
-                    **kwargs
-                )
+                self.model = self._load_pretrained(AutoModelForQuestionAnswering, **model_kwargs)
             elif self.task == "summarization":
-                self.model = AutoModelForSeq2SeqLM.from_pretrained(
-                    self.model_name,
-                    cache_dir=self.cache_dir,
-                    **kwargs
-                )
+                self.model = self._load_pretrained(AutoModelForSeq2SeqLM, **model_kwargs)
             else:
                 raise ValueError(f"Unsupported task: {self.task}")
             
-            # Move model to device
-            self.model.to(self.device)
+            # Move model to device unless device_map or bitsandbytes already placed it
+            if "device_map" not in model_kwargs and not self.weight_quantized:
+                self.model.to(self.device)
             self.model.eval()
             
-            # Create pipeline for easy inference
-            self.pipeline = pipeline(
-                self.task,
-                model=self.model,
-                tokenizer=self.tokenizer,
-                device=0 if self.device == "cuda" else -1
-            )
+            # Parameter counts only change when the model is reloaded
+            self._model_size = get_model_size(self.model)
+            
+            # Compile the forward in place so generate() runs through it; prompt
+            # and cache lengths change on every step and request, so compile
+            # with dynamic shapes instead of recompiling (and recapturing CUDA
+            # graphs) for each new length
+            if self.compile_model and hasattr(torch, "compile"):
+                self.model.forward = torch.compile(
+                    self.model.forward,
+                    fullgraph=False,
+                    dynamic=True
+                )
+                self._warmup_model()
             
             logger.info(f"Model {self.model_name} loaded successfully")
             
@@ -146,6 +180,111 @@ class TransformerModel:
             logger.error(f"Error loading model {self.model_name}: {str(e)}")
             raise
     
+    def _load_pretrained(self, model_class, **kwargs):
+        """
+        Load a model, preferring FlashAttention-2 and then SDPA attention on CUDA.
+        
+        Args:
+            model_class: transformers Auto class to load with
+            **kwargs: Additional arguments for from_pretrained
+            
+        Returns:
+            The loaded model
+        """
+        implementations = []
+        if self.device == "cuda" and "attn_implementation" not in kwargs:
+            # FlashAttention-2 needs Ampere (SM 8.0) or newer and the flash_attn package
+            if torch.cuda.get_device_capability()[0] >= 8 and importlib.util.find_spec("flash_attn") is not None:
+                implementations.append("flash_attention_2")
+            implementations.append("sdpa")
+        
+        for attn_implementation in implementations:
+            attn_kwargs = {"attn_implementation": attn_implementation}
+            
+            # FlashAttention-2 only runs in FP16/BF16
+            if attn_implementation == "flash_attention_2" and "torch_dtype" not in kwargs:
+                attn_kwargs["torch_dtype"] = torch.bfloat16
+            
+            try:
+                return model_class.from_pretrained(
+                    self.model_name,
+                    cache_dir=self.cache_dir,
+                    **attn_kwargs,
+                    **kwargs
+                )
+            except (ValueError, ImportError) as e:
+                logger.warning(f"{attn_implementation} attention unavailable for {self.model_name}: {str(e)}")
+        
+        return model_class.from_pretrained(
+            self.model_name,
+            cache_dir=self.cache_dir,
+            **kwargs
+        )
+    
+    def _placement_kwargs(self) -> Dict[str, Any]:
+        """
+        Loading arguments that place weights directly on the CUDA device.
+        
+        With accelerate installed, from_pretrained builds the model on the
+        meta device and copies each tensor from the checkpoint to the GPU,
+        so there is no full host-side copy and no second model-sized move.
+        
+        Returns:
+            low_cpu_mem_usage and device_map, or nothing off CUDA
+        """
+        if self.device != "cuda" or importlib.util.find_spec("accelerate") is None:
+            return {}
+        
+        return {
+            "low_cpu_mem_usage": True,
+            "device_map": {"": torch.cuda.current_device()}
+        }
+    
+    def _causal_lm_load_kwargs(self) -> Dict[str, Any]:
+        """Dtype and quantization arguments for loading the causal LM."""
+        if self.device != "cuda":
+            if self.quantization != "bf16":
+                logger.warning(f"{self.quantization} quantization requires CUDA, loading {self.model_name} in FP32")
+            return {"torch_dtype": torch.float32}
+        
+        # BF16 needs Ampere (SM 8.0) or newer
+        compute_dtype = torch.bfloat16 if torch.cuda.get_device_capability()[0] >= 8 else torch.float16
+        
+        if self.quantization == "nf4":
+            return {
+                "torch_dtype": compute_dtype,
+                "quantization_config": BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=compute_dtype,
+                    bnb_4bit_use_double_quant=True
+                )
+            }
+        
+        if self.quantization == "int8":
+            return {
+                "torch_dtype": compute_dtype,
+                "quantization_config": BitsAndBytesConfig(load_in_8bit=True)
+            }
+        
+        return {"torch_dtype": compute_dtype}
+    
+    def _warmup_model(self):
+        """Run one short generation so the compile cost is paid at load time."""
+        inputs = self.tokenizer(
+            "Warmup input for model compilation.",
+            return_tensors="pt"
+        ).to(self.device)
+        
+        with torch.inference_mode():
+            self.model.generate(
+                **inputs,
+                max_new_tokens=8,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        
+        logger.info(f"Compiled and warmed up {self.model_name}")
+    
     def generate(
         self,
         prompt: str,
@@ -168,6 +307,9 @@ class TransformerModel:
         
         params = params or GenerationParams()
         
+        # Reuse past key/values between steps even if the checkpoint config disabled the cache
+        kwargs.setdefault("use_cache", True)
+        
         # Prepare generation config
         generation_config = GenerationConfig(
             max_length=params.max_length,
@@ -206,37 +348,148 @@ class TransformerModel:
         
         return generated_text
     
-    def classify(self, text: str) -> Dict[str, Any]:
+    def _encode(self, text: Union[str, List[str]], text_pair: Optional[str] = None, **kwargs):
+        """Tokenize inputs into CPU tensors."""
+        return self.tokenizer(
+            text,
+            text_pair,
+            return_tensors="pt",
+            padding=True,
+            truncation=kwargs.pop("truncation", True),
+            **kwargs
+        )
+    
+    def _forward(self, inputs):
         """
-        Classify the given text.
+        Run the model directly on tokenized inputs.
         
         Args:
-            text: Input text to classify
+            inputs: Tokenizer output; offset mappings are not passed to the model
             
         Returns:
-            Classification results
+            Model outputs
+        """
+        model_inputs = {
+            name: tensor.to(self.device, non_blocking=True)
+            for name, tensor in inputs.items()
+            if name != "offset_mapping"
+        }
+        
+        with torch.inference_mode():
+            return self.model(**model_inputs)
+    
+    def _run_in_buckets(self, texts: List[str], batch_fn, batch_size: int) -> List[Any]:
+        """
+        Apply a batched function to texts grouped by similar length.
+        
+        Args:
+            texts: Input texts
+            batch_fn: Function mapping a list of texts to a list of results
+            batch_size: Number of texts per model call
+            
+        Returns:
+            Results in the order of the input texts
+        """
+        # Character length is a cheap proxy for token length; sorting keeps
+        # the padding in each batch small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            for index, result in zip(indices, batch_fn([texts[i] for i in indices])):
+                results[index] = result
+        
+        return results
+    
+    def _classify_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Classify a batch of texts with one forward pass."""
+        logits = self._forward(self._encode(texts)).logits
+        
+        # Softmax and argmax on the device; copy back two values per text
+        scores, indices = torch.softmax(logits.float(), dim=-1).max(dim=-1)
+        
+        return [
+            {"label": self.model.config.id2label[index], "score": score}
+            for index, score in zip(indices.tolist(), scores.tolist())
+        ]
+    
+    def classify(
+        self,
+        text: Union[str, List[str]],
+        batch_size: int = 32
+    ) -> List[Dict[str, Any]]:
+        """
+        Classify the given text or texts.
+        
+        Args:
+            text: Input text, or a list of texts to classify in batches
+            batch_size: Number of texts per forward pass
+            
+        Returns:
+            Classification results, one per input text
         """
         if self.task != "classification":
             raise ValueError(f"Model is not configured for classification (task: {self.task})")
         
-        result = self.pipeline(text)
-        return result
+        texts = [text] if isinstance(text, str) else text
+        return self._run_in_buckets(texts, self._classify_batch, batch_size)
+    
+    def _extract_entities_batch(self, texts: List[str]) -> List[List[Dict[str, Any]]]:
+        """Extract entities from a batch of texts with one forward pass."""
+        inputs = self._encode(texts, return_offsets_mapping=True, return_special_tokens_mask=True)
+        special_tokens_mask = inputs.pop("special_tokens_mask").tolist()
+        logits = self._forward(inputs).logits
+        
+        scores, indices = torch.softmax(logits.float(), dim=-1).max(dim=-1)
+        scores, indices = scores.tolist(), indices.tolist()
+        offsets = inputs["offset_mapping"].tolist()
+        
+        # One entry per non-special token with a label other than "O";
+        # padding is marked as special, so it is skipped too
+        results = []
+        for row in range(len(texts)):
+            tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][row])
+            entities = []
+            for index, token in enumerate(tokens):
+                label = self.model.config.id2label[indices[row][index]]
+                if special_tokens_mask[row][index] or label == "O":
+                    continue
+                
+                start, end = offsets[row][index]
+                entities.append({
+                    "entity": label,
+                    "score": scores[row][index],
+                    "index": index,
+                    "word": token,
+                    "start": start,
+                    "end": end
+                })
+            results.append(entities)
+        
+        return results
     
-    def extract_entities(self, text: str) -> List[Dict[str, Any]]:
+    def extract_entities(
+        self,
+        text: Union[str, List[str]],
+        batch_size: int = 32
+    ) -> Union[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
         """
-        Extract named entities from the given text.
+        Extract named entities from the given text or texts.
         
         Args:
-            text: Input text
+            text: Input text, or a list of texts to process in batches
+            batch_size: Number of texts per forward pass
             
         Returns:
-            List of extracted entities
+            List of extracted entities, or one such list per input text
         """
         if self.task != "ner":
             raise ValueError(f"Model is not configured for NER (task: {self.task})")
         
-        result = self.pipeline(text)
-        return result
+        if isinstance(text, str):
+            return self._extract_entities_batch([text])[0]
+        return self._run_in_buckets(text, self._extract_entities_batch, batch_size)
     
     def answer_question(self, question: str, context: str) -> Dict[str, Any]:
         """
@@ -252,25 +505,63 @@ class TransformerModel:
         if self.task != "qa":
             raise ValueError(f"Model is not configured for QA (task: {self.task})")
         
-        result = self.pipeline(question=question, context=context)
-        return result
+        inputs = self._encode(question, context, truncation="only_second", return_offsets_mapping=True)
+        outputs = self._forward(inputs)
+        
+        # Only context tokens can start or end the answer
+        context_mask = torch.tensor(
+            [sequence_id == 1 for sequence_id in inputs.sequence_ids(0)],
+            device=outputs.start_logits.device
+        )
+        start_probs = torch.softmax(outputs.start_logits[0].float().masked_fill(~context_mask, float("-inf")), dim=-1)
+        end_probs = torch.softmax(outputs.end_logits[0].float().masked_fill(~context_mask, float("-inf")), dim=-1)
+        
+        # Best span with start <= end and at most 15 tokens
+        span_scores = torch.outer(start_probs, end_probs).triu().tril(diagonal=14)
+        score, best = span_scores.flatten().max(dim=-1)
+        start_index, end_index = divmod(int(best), span_scores.shape[1])
+        
+        offsets = inputs["offset_mapping"][0].tolist()
+        start, end = offsets[start_index][0], offsets[end_index][1]
+        
+        return {
+            "score": float(score),
+            "start": start,
+            "end": end,
+            "answer": context[start:end]
+        }
     
-    def summarize(self, text: str, max_length: int = 150) -> str:
+    def summarize(
+        self,
+        text: Union[str, List[str]],
+        max_length: int = 150,
+        batch_size: int = 32
+    ) -> Union[str, List[str]]:
         """
-        Summarize the given text.
+        Summarize the given text or texts.
         
         Args:
-            text: Input text to summarize
+            text: Input text, or a list of texts to summarize in batches
             max_length: Maximum length of the summary
+            batch_size: Number of texts per generate call
             
         Returns:
-            Generated summary
+            Generated summary, or one summary per input text
         """
         if self.task != "summarization":
             raise ValueError(f"Model is not configured for summarization (task: {self.task})")
         
-        result = self.pipeline(text, max_length=max_length, min_length=30)
-        return result[0]['summary_text']
+        def summarize_batch(texts: List[str]) -> List[str]:
+            inputs = self._encode(texts).to(self.device)
+            
+            with torch.inference_mode():
+                outputs = self.model.generate(**inputs, max_length=max_length, min_length=30)
+            
+            return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        
+        if isinstance(text, str):
+            return summarize_batch([text])[0]
+        return self._run_in_buckets(text, summarize_batch, batch_size)
     
     def fine_tune(
         self,
@@ -336,8 +627,7 @@ class TransformerModel:
             "device": self.device
         }
         
-        with open(os.path.join(path, "metadata.json"), "w") as f:
-            json.dump(metadata, f, indent=2)
+        save_json(metadata, os.path.join(path, "metadata.json"))
         
         logger.info(f"Model saved to {path}")
     
@@ -346,17 +636,20 @@ class TransformerModel:
         """Load a saved model from the specified path."""
         metadata_path = os.path.join(path, "metadata.json")
         
+        # Memory-map safetensors shards instead of unpickling a .bin into RAM
+        load_kwargs = {"use_safetensors": True} if has_safetensors_weights(path) else {}
+        
         if os.path.exists(metadata_path):
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
+            metadata = load_json(metadata_path)
             
             return cls(
                 model_name=path,
                 task=metadata.get("task", "text-generation"),
-                device=device or metadata.get("device", "cpu")
+                device=device or metadata.get("device", "cpu"),
+                **load_kwargs
             )
         else:
-            return cls(model_name=path, device=device)
+            return cls(model_name=path, device=device, **load_kwargs)
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the model."""
@@ -364,6 +657,7 @@ class TransformerModel:
             "model_name": self.model_name,
             "task": self.task,
             "device": self.device,
-            "num_parameters": sum(p.numel() for p in self.model.parameters()),
-            "trainable_parameters": sum(p.numel() for p in self.model.parameters() if p.requires_grad)
+            "num_parameters": self._model_size["total_parameters"],
+            "trainable_parameters": self._model_size["trainable_parameters"],
+            "memory_usage_mb": self._model_size["memory_usage_mb"]
         }
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Request batching utilities.
+
+Coalesces concurrent single-item inference calls into one batched model call.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Queued by close() to stop the worker once earlier items are served
+_STOP = object()
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler for concurrent requests.
+    
+    Callers await submit(item). A background task collects queued items
+    until max_batch_size are waiting or max_wait_ms has passed since
+    the first one arrived, runs batch_fn once on the whole batch in the
+    default executor, and resolves each caller with its own result.
+    """
+    
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0
+    ):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            batch_fn: Function mapping a list of items to a list of results
+            max_batch_size: Maximum number of items per batch
+            max_wait_ms: Maximum time to wait for a batch to fill
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _ensure_worker(self):
+        """Start the batching task on the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+    
+    def close(self):
+        """Stop the batching task after the items already queued are served."""
+        if self._worker is not None and not self._worker.done():
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, _STOP)
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result.
+        
+        Args:
+            item: Single input for batch_fn
+            
+        Returns:
+            The result for this item
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+    
+    async def _collect_batch(self) -> Optional[List[Tuple[Any, asyncio.Future]]]:
+        """Wait for the first item, then gather more until full or timed out."""
+        first = await self._queue.get()
+        if first is _STOP:
+            return None
+        
+        batch = [first]
+        deadline = self._loop.time() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if entry is _STOP:
+                # Serve this batch first, then stop on the next collect
+                self._queue.put_nowait(_STOP)
+                break
+            batch.append(entry)
+        
+        return batch
+    
+    async def _run(self):
+        """Drain the queue batch by batch."""
+        while True:
+            batch = await self._collect_batch()
+            if batch is None:
+                return
+            items = [item for item, _ in batch]
+            
+            try:
+                results = await self._loop.run_in_executor(None, self.batch_fn, items)
+            except Exception as e:
+                logger.error(f"Error in batched call of {len(items)} items: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
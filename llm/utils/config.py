@@ -5,7 +5,34 @@ Configuration utilities for the LLM package.
 import os
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
-import json
+
+# orjson is several times faster than the stdlib json module; fall back if missing
+try:
+    import orjson
+    
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+    
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+except ImportError:
+    import json
+    
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+    
+    def _dumps(obj: Any) -> str:
+        return json.dumps(obj, indent=2)
+
+def load_json(file_path: str) -> Any:
+    """Load a JSON file."""
+    with open(file_path, 'rb') as f:
+        return _loads(f.read())
+
+def save_json(obj: Any, file_path: str):
+    """Save an object to a JSON file with 2-space indentation."""
+    with open(file_path, 'w') as f:
+        f.write(_dumps(obj))
 
 @dataclass
 class Config:
@@ -40,8 +67,7 @@ class Config:
     @classmethod
     def from_file(cls, file_path: str) -> 'Config':
         """Load Config from JSON file."""
-        with open(file_path, 'r') as f:
-            config_dict = json.load(f)
+        config_dict = load_json(file_path)
         return cls.from_dict(config_dict)
     
     def to_dict(self) -> Dict[str, Any]:
@@ -66,8 +92,7 @@ class Config:
     
     def save(self, file_path: str):
         """Save Config to JSON file."""
-        with open(file_path, 'w') as f:
-            json.dump(self.to_dict(), f, indent=2)
+        save_json(self.to_dict(), file_path)
     
     def get_device(self) -> str:
         """Get the appropriate device for the model."""
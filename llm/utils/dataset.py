@@ -3,10 +3,12 @@ Dataset utilities for language model training.
 """
 
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import Dataset, DataLoader, Sampler
 from typing import List, Dict, Optional, Tuple
 import numpy as np
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -19,42 +21,155 @@ class TextDataset(Dataset):
         self.max_length = max_length
         
         # Tokenize all texts
-        self.encoded_texts = []
-        for text in texts:
-            tokens = tokenizer.encode(text)
+        encoded_texts = []
+        for tokens in self._tokenize_all(texts):
             if len(tokens) > max_length:
                 # Split long sequences
                 for i in range(0, len(tokens), max_length):
                     chunk = tokens[i:i + max_length]
                     if len(chunk) >= 10:  # Minimum sequence length
-                        self.encoded_texts.append(chunk)
+                        encoded_texts.append(chunk)
             else:
-                self.encoded_texts.append(tokens)
+                encoded_texts.append(tokens)
+        
+        # Store the corpus as one padded int32 tensor plus per-row lengths;
+        # attention masks are derived from the lengths when batches are built
+        self.input_ids = torch.zeros((len(encoded_texts), max_length), dtype=torch.int32)
+        self.lengths = torch.tensor([len(tokens) for tokens in encoded_texts], dtype=torch.int32)
+        for i, tokens in enumerate(encoded_texts):
+            self.input_ids[i, :len(tokens)] = torch.as_tensor(tokens, dtype=torch.int32)
+        
+        self._positions = torch.arange(max_length)
+    
+    def _tokenize_all(self, texts: List[str]) -> List[List[int]]:
+        """Tokenize all texts, in one batched call when the tokenizer supports it."""
+        if callable(self.tokenizer):
+            # HuggingFace tokenizers encode the whole list in one call (in
+            # parallel for fast tokenizers)
+            return self.tokenizer(
+                texts,
+                add_special_tokens=True,
+                truncation=False,
+                return_attention_mask=False
+            )["input_ids"]
+        
+        return [self.tokenizer.encode(text) for text in texts]
     
     def __len__(self):
-        return len(self.encoded_texts)
+        return len(self.lengths)
     
     def __getitem__(self, idx):
-        tokens = self.encoded_texts[idx]
-        
-        # Pad or truncate to max_length
-        if len(tokens) < self.max_length:
-            tokens = tokens + [0] * (self.max_length - len(tokens))
-        else:
-            tokens = tokens[:self.max_length]
-        
+        # Unpadded; collate_batch pads to the longest sequence in the batch
+        length = int(self.lengths[idx])
         return {
-            "input_ids": torch.tensor(tokens, dtype=torch.long),
-            "attention_mask": torch.tensor([1] * len(tokens), dtype=torch.long)
+            "input_ids": self.input_ids[idx, :length].long(),
+            "attention_mask": torch.ones(length, dtype=torch.long)
         }
+    
+    def __getitems__(self, indices: List[int]) -> Dict[str, torch.Tensor]:
+        """
+        Fetch a whole batch with one indexing op per tensor.
+        
+        DataLoader calls this instead of __getitem__ per sample; the result
+        is already a batch, padded only to its longest sequence, which
+        collate_batch passes through. The attention mask is left out when
+        no row is padded, so the model can use its causal fast path.
+        """
+        indices = torch.as_tensor(indices)
+        lengths = self.lengths[indices]
+        batch_length = int(lengths.max())
+        
+        batch = {"input_ids": self.input_ids[indices, :batch_length].long()}
+        if int(lengths.min()) < batch_length:
+            batch["attention_mask"] = (self._positions[:batch_length] < lengths[:, None]).long()
+        
+        return batch
+
+class LengthGroupedSampler(Sampler):
+    """
+    Random sampler that keeps similarly sized sequences in the same batch.
+    
+    Each epoch the indices are shuffled, split into mega-batches of
+    mega_batch_mult * batch_size, and each mega-batch is sorted by length,
+    so consecutive batches need little padding while batch order stays random.
+    """
+    
+    def __init__(self, lengths: torch.Tensor, batch_size: int, mega_batch_mult: int = 50):
+        self.lengths = lengths
+        self.mega_batch_size = batch_size * mega_batch_mult
+    
+    def __len__(self):
+        return len(self.lengths)
+    
+    def __iter__(self):
+        indices = torch.randperm(len(self.lengths))
+        for mega_batch in indices.split(self.mega_batch_size):
+            order = torch.argsort(self.lengths[mega_batch], descending=True)
+            yield from mega_batch[order].tolist()
+
+def collate_batch(batch):
+    """
+    Pad per-sample dicts to the longest sequence, or pass through a batch built by __getitems__.
+    
+    The attention mask is only included when some sequence is padded; an
+    unpadded batch needs none, and checking here on the CPU avoids a
+    device sync in the model's forward.
+    """
+    if isinstance(batch, dict):
+        return batch
+    
+    collated = {
+        "input_ids": pad_sequence([sample["input_ids"] for sample in batch], batch_first=True, padding_value=0)
+    }
+    if len({len(sample["input_ids"]) for sample in batch}) > 1:
+        collated["attention_mask"] = pad_sequence([sample["attention_mask"] for sample in batch], batch_first=True, padding_value=0)
+    
+    return collated
 
 def create_dataloader(
     texts: List[str],
     tokenizer,
     batch_size: int = 8,
     max_length: int = 512,
-    shuffle: bool = True
+    shuffle: bool = True,
+    num_workers: Optional[int] = None,
+    pin_memory: Optional[bool] = None,
+    group_by_length: bool = False,
+    prefetch_factor: int = 4,
+    drop_last: Optional[bool] = None
 ) -> DataLoader:
-    """Create a DataLoader for training."""
+    """Create a DataLoader for training.
+    
+    Batches are pinned by default when CUDA is available so host-to-device
+    copies can run with non_blocking=True (see CUDAPrefetcher). Each batch
+    is padded only to its longest sequence; with group_by_length (and
+    shuffle), batches are also drawn from length-sorted mega-batches.
+    
+    Up to 8 worker processes (one per core) build batches ahead of the
+    training step, each keeping prefetch_factor batches in flight. Training
+    loaders (shuffle=True) drop the ragged last batch unless drop_last is set.
+    """
     dataset = TextDataset(texts, tokenizer, max_length)
-    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
\ No newline at end of file
+    if num_workers is None:
+        num_workers = min(8, os.cpu_count() or 1)
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+    if drop_last is None:
+        drop_last = shuffle
+    
+    sampler = None
+    if shuffle and group_by_length:
+        sampler = LengthGroupedSampler(dataset.lengths, batch_size)
+    
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle and sampler is None,
+        sampler=sampler,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=num_workers > 0,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        drop_last=drop_last,
+        collate_fn=collate_batch
+    )
\ No newline at end of file
@@ -3,12 +3,13 @@ Helper utilities for the LLM package.
 """
 
 import os
-import json
 import logging
 from typing import Dict, Any, List, Optional
 import torch
 import numpy as np
 
+from .config import load_json, save_json
+
 logger = logging.getLogger(__name__)
 
 def setup_logging(level: str = "INFO", log_file: Optional[str] = None):
@@ -37,15 +38,20 @@ def setup_logging(level: str = "INFO", log_file: Optional[str] = None):
 
 def get_model_size(model: torch.nn.Module) -> Dict[str, Any]:
     """Get model size information."""
-    total_params = sum(p.numel() for p in model.parameters())
-    trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total_params = 0
+    trainable_params = 0
     
     # Estimate memory usage
     param_size = 0
     buffer_size = 0
     
+    # Count parameters and their bytes in a single pass
     for param in model.parameters():
-        param_size += param.nelement() * param.element_size()
+        num_elements = param.numel()
+        total_params += num_elements
+        if param.requires_grad:
+            trainable_params += num_elements
+        param_size += num_elements * param.element_size()
     
     for buffer in model.buffers():
         buffer_size += buffer.nelement() * buffer.element_size()
@@ -63,8 +69,7 @@ def save_model_metadata(model_info: Dict[str, Any], file_path: str):
     """Save model metadata to file."""
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
-    with open(file_path, 'w') as f:
-        json.dump(model_info, f, indent=2)
+    save_json(model_info, file_path)
     
     logger.info(f"Model metadata saved to {file_path}")
 
@@ -73,19 +78,26 @@ def load_model_metadata(file_path: str) -> Dict[str, Any]:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Metadata file not found: {file_path}")
     
-    with open(file_path, 'r') as f:
-        metadata = json.load(f)
-    
-    return metadata
+    return load_json(file_path)
+
+SAFETENSORS_WEIGHT_FILES = ["model.safetensors", "model.safetensors.index.json"]
+PICKLE_WEIGHT_FILES = ["pytorch_model.bin", "pytorch_model.bin.index.json"]
+
+def has_safetensors_weights(model_path: str) -> bool:
+    """Check whether a model directory has safetensors weights (single file or shard index)."""
+    return any(
+        os.path.exists(os.path.join(model_path, file_name))
+        for file_name in SAFETENSORS_WEIGHT_FILES
+    )
 
 def validate_model_path(model_path: str) -> bool:
     """Validate that a model path exists and contains required files."""
     if not os.path.exists(model_path):
         return False
     
-    # Check for common model files
+    # Check for common model files, safetensors first
     required_files = ["config.json"]
-    optional_files = ["pytorch_model.bin", "model.safetensors", "tokenizer.json"]
+    optional_files = SAFETENSORS_WEIGHT_FILES + PICKLE_WEIGHT_FILES + ["tokenizer.json"]
     
     # Check required files
     for file_name in required_files:
@@ -93,12 +105,18 @@ def validate_model_path(model_path: str) -> bool:
             return False
     
     # Check at least one model file exists
-    model_files_exist = any(
-        os.path.exists(os.path.join(model_path, file_name))
-        for file_name in optional_files
-    )
+    model_files = [
+        file_name for file_name in optional_files
+        if os.path.exists(os.path.join(model_path, file_name))
+    ]
+    
+    # Pickled checkpoints are unpickled into RAM in full before moving to the device
+    if model_files and not has_safetensors_weights(model_path) and any(
+        file_name in PICKLE_WEIGHT_FILES for file_name in model_files
+    ):
+        logger.warning(f"Only pytorch_model.bin weights found in {model_path}; convert to safetensors for memory-mapped loading")
     
-    return model_files_exist
+    return bool(model_files)
 
 def format_model_size(size_bytes: int) -> str:
     """Format model size in human readable format."""
@@ -108,20 +126,45 @@ def format_model_size(size_bytes: int) -> str:
         size_bytes /= 1024.0
     return f"{size_bytes:.2f} PB"
 
-def calculate_metrics(predictions: List[Any], targets: List[Any]) -> Dict[str, float]:
-    """Calculate basic metrics for model evaluation."""
+def calculate_metrics(
+    predictions: List[Any],
+    targets: List[Any],
+    scores: Optional[Any] = None,
+    k: int = 5
+) -> Dict[str, float]:
+    """Calculate basic metrics for model evaluation.
+    
+    If scores (an [N, num_classes] array) is given and targets are class
+    indices, top-k accuracy is reported as well.
+    """
     if len(predictions) != len(targets):
         raise ValueError("Predictions and targets must have the same length")
     
-    # Calculate accuracy
-    correct = sum(1 for p, t in zip(predictions, targets) if p == t)
+    # Calculate accuracy with one vectorized comparison; mixed or nested
+    # labels (object arrays) keep the elementwise Python comparison
+    pred_array = np.asarray(predictions)
+    target_array = np.asarray(targets)
+    if pred_array.dtype == object or target_array.dtype == object or pred_array.ndim != 1:
+        correct = sum(1 for p, t in zip(predictions, targets) if p == t)
+    else:
+        correct = int((pred_array == target_array).sum())
     accuracy = correct / len(predictions)
     
-    return {
+    metrics = {
         "accuracy": accuracy,
         "total_samples": len(predictions),
         "correct_predictions": correct
     }
+    
+    if scores is not None:
+        scores = np.asarray(scores)
+        k = min(k, scores.shape[1])
+        
+        # argpartition finds the k best classes per row without a full sort
+        top_k = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        metrics[f"top_{k}_accuracy"] = float((top_k == target_array[:, None]).any(axis=1).mean())
+    
+    return metrics
 
 def create_model_summary(model: torch.nn.Module, input_shape: tuple = None) -> Dict[str, Any]:
     """Create a summary of the model architecture."""
@@ -138,7 +181,7 @@ def create_model_summary(model: torch.nn.Module, input_shape: tuple = None) -> D
     
     # Add layer information
     for name, module in model.named_modules():
-        if len(list(module.children())) == 0:  # Leaf modules only
+        if next(module.children(), None) is None:  # Leaf modules only
             layer_info = {
                 "name": name,
                 "type": type(module).__name__,
@@ -184,11 +227,26 @@ def cleanup_gpu_memory():
         torch.cuda.empty_cache()
         logger.info("GPU memory cleaned up")
 
-def get_optimal_batch_size(model: torch.nn.Module, max_memory_gb: float = 8.0) -> int:
-    """Estimate optimal batch size based on available memory."""
+def get_optimal_batch_size(
+    model: torch.nn.Module,
+    max_memory_gb: float = 8.0,
+    sample_input_shape: Optional[tuple] = None,
+    input_dtype: torch.dtype = torch.long
+) -> int:
+    """Estimate optimal batch size based on available memory.
+    
+    With sample_input_shape (the shape of one sample, e.g. (seq_len,) for
+    token IDs), the activation memory of a single sample is measured with a
+    forward pass and the batch size is the largest power of two that fits
+    in 90% of the free memory. Otherwise a rough estimate from the model
+    size is used.
+    """
     if not torch.cuda.is_available():
         return 8  # Default for CPU
     
+    if sample_input_shape is not None:
+        return _probe_batch_size(model, max_memory_gb, sample_input_shape, input_dtype)
+    
     # Get model size
     size_info = get_model_size(model)
     model_memory_gb = size_info["memory_usage_gb"]
@@ -204,4 +262,37 @@ def get_optimal_batch_size(model: torch.nn.Module, max_memory_gb: float = 8.0) -
     optimal_batch_size = min(optimal_batch_size, 32)
     
     logger.info(f"Estimated optimal batch size: {optimal_batch_size}")
+    return optimal_batch_size
+
+def _probe_batch_size(
+    model: torch.nn.Module,
+    max_memory_gb: float,
+    sample_input_shape: tuple,
+    input_dtype: torch.dtype
+) -> int:
+    """Measure per-sample peak memory with a batch-size-1 forward pass."""
+    device = next(model.parameters()).device
+    sample = torch.zeros((1, *sample_input_shape), dtype=input_dtype, device=device)
+    
+    torch.cuda.synchronize(device)
+    baseline = torch.cuda.memory_allocated(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    
+    # Keep autograd on so the activations saved for backward are counted
+    output = model(sample)
+    torch.cuda.synchronize(device)
+    bytes_per_sample = max(torch.cuda.max_memory_allocated(device) - baseline, 1)
+    del output
+    
+    free_bytes, _ = torch.cuda.mem_get_info(device)
+    budget = min(free_bytes, max_memory_gb * 1024**3 - baseline)
+    max_batch_size = max(1, int(0.9 * budget / bytes_per_sample))
+    
+    # Round down to a power of two so batch dimensions stay tensor-core aligned
+    optimal_batch_size = 1 << (max_batch_size.bit_length() - 1)
+    
+    logger.info(
+        f"Measured {bytes_per_sample / 1024**2:.1f} MB per sample, "
+        f"optimal batch size: {optimal_batch_size}"
+    )
     return optimal_batch_size
\ No newline at end of file
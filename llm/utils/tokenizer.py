@@ -6,13 +6,303 @@ A simple but effective tokenizer for the language model.
 
 import re
 import json
+import mmap
 import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Optional, Tuple, Union
-from collections import Counter
+from collections import Counter, deque
 import logging
+import numpy as np
+
+from .config import load_json, save_json
 
 logger = logging.getLogger(__name__)
 
+# Bound on distinct unknown words whose token IDs are memoized per tokenizer
+WORD_CACHE_SIZE = 131072
+
+# Leading bytes of the binary tokenizer format
+BINARY_MAGIC = b"STOK"
+
+class TrieNode:
+    """
+    Node of the vocabulary trie used for greedy longest-match tokenization.
+    
+    failure and failure_pops follow LinMaxMatch (Song et al., 2021): when
+    the next character has no child, emit failure_pops and continue
+    matching from failure, so every character is visited a bounded number
+    of times instead of rescanning substrings.
+    """
+    
+    __slots__ = ("children", "token_id", "failure", "failure_pops")
+    
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.token_id: Optional[int] = None
+        self.failure: Optional["TrieNode"] = None
+        self.failure_pops: List[int] = []
+
+def _most_common(keys: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Distinct keys ordered like Counter.most_common.
+    
+    Args:
+        keys: Integer key per occurrence
+        weights: Count contributed by each occurrence
+        
+    Returns:
+        Distinct keys by descending total weight, ties in first-seen order
+    """
+    unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    totals = np.bincount(inverse, weights=weights, minlength=len(unique_keys))
+    return unique_keys[np.lexsort((first_index, -totals))]
+
+# Tokenizer copy held by each encode_batch worker process
+_worker_tokenizer = None
+
+def _init_worker(tokenizer):
+    """Store the tokenizer in a worker process."""
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+def _encode_chunk(texts: List[str]) -> List[List[int]]:
+    """Encode a chunk of texts in a worker process."""
+    return [_worker_tokenizer.encode(text) for text in texts]
+
+def _encode_texts(tokenizer, texts: List[str], num_workers: int) -> List[List[int]]:
+    """
+    Encode texts serially or across worker processes.
+    
+    encode is pure Python and holds the GIL, so processes rather than
+    threads are needed for a speedup. The tokenizer is sent to each
+    worker once, and texts go in contiguous chunks.
+    
+    Args:
+        tokenizer: Tokenizer with an encode method
+        texts: Input texts
+        num_workers: Number of worker processes (0 for serial)
+        
+    Returns:
+        Token IDs per text, in input order
+    """
+    if num_workers <= 0 or len(texts) < 2:
+        return [tokenizer.encode(text) for text in texts]
+    
+    num_workers = min(num_workers, len(texts))
+    chunk_size = max(1, len(texts) // (4 * num_workers))
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(tokenizer,)) as pool:
+        return [ids for chunk in pool.map(_encode_chunk, chunks) for ids in chunk]
+
+def _pad_batch(
+    encoded: List[List[int]],
+    pad_id: int,
+    padding: bool,
+    truncation: bool,
+    max_length: Optional[int],
+    return_numpy: bool
+) -> Dict[str, Union[List[List[int]], np.ndarray]]:
+    """
+    Truncate and pad encoded sequences into input IDs and an attention mask.
+    
+    Args:
+        encoded: Token IDs per text
+        pad_id: ID used for padding
+        padding: Whether to pad to the longest sequence
+        truncation: Whether to truncate to max_length
+        max_length: Maximum sequence length (defaults to the longest sequence)
+        return_numpy: Whether to return arrays instead of lists when padding
+        
+    Returns:
+        Dictionary with 'input_ids' and 'attention_mask'
+    """
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    
+    if max_length is None:
+        max_length = int(lengths.max()) if encoded else 0
+    
+    if truncation:
+        encoded = [seq[:max_length] for seq in encoded]
+        lengths = np.minimum(lengths, max_length)
+    
+    if not padding:
+        return {
+            "input_ids": encoded,
+            "attention_mask": [[1] * len(seq) for seq in encoded]
+        }
+    
+    # Fill one preallocated array; the mask is a single broadcast comparison
+    max_len = int(lengths.max()) if encoded else 0
+    input_ids = np.full((len(encoded), max_len), pad_id, dtype=np.int64)
+    for row, seq in enumerate(encoded):
+        input_ids[row, :len(seq)] = seq
+    attention_mask = (np.arange(max_len) < lengths[:, None]).astype(np.int64)
+    
+    if return_numpy:
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+    
+    return {
+        "input_ids": input_ids.tolist(),
+        "attention_mask": attention_mask.tolist()
+    }
+
+def _intern_token(token: Union[str, Tuple[str, ...]]) -> Union[str, Tuple[str, ...]]:
+    """Intern a vocabulary key (or each character of a pair key)."""
+    if isinstance(token, tuple):
+        return tuple(sys.intern(char) for char in token)
+    return sys.intern(token)
+
+class CompactVocab:
+    """
+    ID-to-token lookup stored as one byte buffer plus an offset array.
+    
+    Token i is buffer[offsets[i]:offsets[i + 1]] in UTF-8, so decoding
+    needs two array reads and a slice per token instead of a dict probe,
+    and the table takes a few bytes per token instead of a dict entry
+    and a str object.
+    """
+    
+    def __init__(self, vocab: Dict):
+        """
+        Build the buffer from a token to ID mapping.
+        
+        Args:
+            vocab: Token to ID mapping; pair tuples decode to their joined text
+        """
+        by_id = {}
+        for token, token_id in vocab.items():
+            by_id[token_id] = "".join(token) if isinstance(token, tuple) else token
+        
+        size = max(by_id) + 1 if by_id else 0
+        self.known = np.zeros(size, dtype=bool)
+        self.offsets = np.zeros(size + 1, dtype=np.uint32)
+        
+        pieces = []
+        position = 0
+        for token_id in range(size):
+            token = by_id.get(token_id)
+            if token is not None:
+                data = token.encode("utf-8", "surrogatepass")
+                pieces.append(data)
+                position += len(data)
+                self.known[token_id] = True
+            self.offsets[token_id + 1] = position
+        self.buffer = b"".join(pieces)
+    
+    @classmethod
+    def from_arrays(cls, buffer, offsets: np.ndarray, known: np.ndarray) -> "CompactVocab":
+        """
+        Wrap existing arrays, such as views of a memory-mapped file, without copying.
+        
+        Args:
+            buffer: Bytes-like object holding the concatenated UTF-8 tokens
+            offsets: uint32 array of size + 1 token start offsets
+            known: Boolean array marking which IDs are assigned
+            
+        Returns:
+            CompactVocab backed by the given arrays
+        """
+        vocab = cls.__new__(cls)
+        vocab.buffer = buffer
+        vocab.offsets = offsets
+        vocab.known = known
+        return vocab
+    
+    def __contains__(self, token_id: int) -> bool:
+        return 0 <= token_id < len(self.known) and bool(self.known[token_id])
+    
+    def __getitem__(self, token_id: int) -> str:
+        if token_id not in self:
+            raise KeyError(token_id)
+        return bytes(self.buffer[self.offsets[token_id]:self.offsets[token_id + 1]]).decode("utf-8", "surrogatepass")
+    
+    def decode(self, token_ids: List[int], unk_id: Optional[int] = None) -> str:
+        """
+        Decode token IDs to text.
+        
+        Args:
+            token_ids: List of token IDs
+            unk_id: ID substituted for unknown IDs (dropped if None)
+            
+        Returns:
+            Decoded text
+        """
+        ids = np.asarray(token_ids, dtype=np.int64).reshape(-1)
+        valid = (ids >= 0) & (ids < len(self.known))
+        valid[valid] = self.known[ids[valid]]
+        
+        if unk_id is None:
+            ids = ids[valid]
+        else:
+            ids = np.where(valid, ids, unk_id)
+        
+        starts = self.offsets[ids].tolist()
+        ends = self.offsets[ids + 1].tolist()
+        buffer = self.buffer
+        return b"".join(buffer[start:end] for start, end in zip(starts, ends)).decode("utf-8", "surrogatepass")
+
+def _build_trie(vocab: Dict, unk_id: int) -> TrieNode:
+    """
+    Build the matching trie with precomputed failure links.
+    
+    Args:
+        vocab: Token to ID mapping; non-string keys (pair tuples) are skipped
+        unk_id: ID emitted for characters that start no token
+        
+    Returns:
+        Root node of the trie
+    """
+    root = TrieNode()
+    for token, token_id in vocab.items():
+        if not isinstance(token, str) or not token:
+            continue
+        node = root
+        for char in token:
+            node = node.children.setdefault(char, TrieNode())
+        node.token_id = token_id
+    
+    # Breadth-first, so parents' links are ready before their children's
+    queue = deque()
+    for child in root.children.values():
+        if child.token_id is not None:
+            child.failure_pops = [child.token_id]
+        else:
+            # A lone character that is not a token becomes <unk>
+            child.failure_pops = [unk_id]
+        child.failure = root
+        queue.append(child)
+    
+    while queue:
+        parent = queue.popleft()
+        for char, node in parent.children.items():
+            queue.append(node)
+            
+            if node.token_id is not None:
+                node.failure_pops = [node.token_id]
+                node.failure = root
+                continue
+            
+            # Emit the parent's tokens, then keep failing until char extends a match
+            pops = list(parent.failure_pops)
+            target = parent.failure
+            while char not in target.children:
+                if target is root:
+                    pops.append(unk_id)
+                    break
+                pops.extend(target.failure_pops)
+                target = target.failure
+            else:
+                target = target.children[char]
+            
+            node.failure_pops = pops
+            node.failure = target
+    
+    return root
+
 class SimpleTokenizer:
     """
     A simple tokenizer implementation for the language model.
@@ -40,14 +330,37 @@ class SimpleTokenizer:
         }
         
         self.vocab = {}
-        self.reverse_vocab = {}
         self.merges = {}
         self.pattern = re.compile(r'\S+|\n')
         
         # Initialize with special tokens
         for token, idx in self.special_tokens.items():
-            self.vocab[token] = idx
-            self.reverse_vocab[idx] = token
+            self.vocab[_intern_token(token)] = idx
+        
+        self._build_lookups()
+    
+    def _build_lookups(self, reverse_vocab: Optional[CompactVocab] = None):
+        """Rebuild the matching trie and ID lookup after the vocabulary changes."""
+        self._trie = _build_trie(self.vocab, self.special_tokens["<unk>"])
+        self.reverse_vocab = reverse_vocab if reverse_vocab is not None else CompactVocab(self.vocab)
+        
+        # Cached results are only valid for the vocabulary they came from
+        self._word_cache = lru_cache(maxsize=WORD_CACHE_SIZE)(self._match_word)
+    
+    def cache_clear(self):
+        """Drop all memoized unknown-word tokenizations."""
+        self._word_cache.cache_clear()
+    
+    def __getstate__(self):
+        """Pickle without derived lookups (for worker processes)."""
+        state = self.__dict__.copy()
+        del state["_trie"], state["_word_cache"], state["reverse_vocab"]
+        return state
+    
+    def __setstate__(self, state):
+        """Restore a pickled tokenizer and rebuild its trie."""
+        self.__dict__.update(state)
+        self._build_lookups()
     
     def train(self, texts: List[str]):
         """
@@ -58,49 +371,70 @@ class SimpleTokenizer:
         """
         logger.info("Training tokenizer...")
         
-        # Count character pairs
-        pair_counts = Counter()
+        # Count words
         word_counts = Counter()
-        
         for text in texts:
-            words = self.pattern.findall(text)
-            for word in words:
-                word_counts[word] += 1
-                if len(word) > 1:
-                    pairs = self._get_pairs(word)
-                    for pair in pairs:
-                        pair_counts[pair] += word_counts[word]
+            word_counts.update(self._split_words(text))
+        
+        # Lay all distinct words end to end as code points, each weighted by its word count
+        words = list(word_counts)
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        chars = np.frombuffer("".join(words).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        weights = np.repeat(np.fromiter(word_counts.values(), dtype=np.float64, count=len(words)), lengths)
+        
+        # Character pairs, packed into one integer (code points fit in 21 bits),
+        # excluding pairs that straddle two words
+        pairs = (chars[:-1].astype(np.uint64) << np.uint64(21)) | chars[1:]
+        within_word = np.ones(len(pairs), dtype=bool)
+        within_word[np.cumsum(lengths)[:-1] - 1] = False
         
         # Build vocabulary
         vocab_size = self.vocab_size - len(self.special_tokens)
         current_vocab_size = len(self.special_tokens)
         
-        # Add single characters first
-        char_counts = Counter()
-        for word, count in word_counts.items():
-            for char in word:
-                char_counts[char] += count
-        
         # Add most frequent characters
-        for char, count in char_counts.most_common(vocab_size // 2):
+        for code in _most_common(chars, weights)[:vocab_size // 2].tolist():
             if current_vocab_size >= self.vocab_size:
                 break
+            char = sys.intern(chr(code))
             if char not in self.vocab:
                 self.vocab[char] = current_vocab_size
-                self.reverse_vocab[current_vocab_size] = char
                 current_vocab_size += 1
         
         # Add most frequent pairs
-        for pair, count in pair_counts.most_common():
+        for code in _most_common(pairs[within_word], weights[:-1][within_word]).tolist():
             if current_vocab_size >= self.vocab_size:
                 break
+            pair = _intern_token((chr(code >> 21), chr(code & 0x1FFFFF)))
             if pair not in self.vocab:
                 self.vocab[pair] = current_vocab_size
-                self.reverse_vocab[current_vocab_size] = pair
                 current_vocab_size += 1
         
+        self._build_lookups()
+        
         logger.info(f"Tokenizer trained with {len(self.vocab)} tokens")
     
+    def _split_words(self, text: str) -> List[str]:
+        """
+        Split text into the same words as self.pattern.findall.
+        
+        str.split uses the same whitespace definition as the pattern's
+        whitespace class and runs without the regex engine, so splitting
+        per line and putting the newlines back is about twice as fast.
+        
+        Args:
+            text: Input text
+            
+        Returns:
+            Non-whitespace runs, with each newline as its own word
+        """
+        lines = text.split("\n")
+        words = lines[0].split()
+        for line in lines[1:]:
+            words.append("\n")
+            words.extend(line.split())
+        return words
+    
     def _get_pairs(self, word: str) -> List[Tuple[str, str]]:
         """Get character pairs from a word."""
         pairs = []
@@ -121,7 +455,7 @@ class SimpleTokenizer:
             List of token IDs
         """
         tokens = []
-        words = self.pattern.findall(text)
+        words = self._split_words(text)
         
         for word in words:
             if word in self.vocab:
@@ -134,30 +468,33 @@ class SimpleTokenizer:
         return tokens
     
     def _tokenize_word(self, word: str) -> List[int]:
-        """Tokenize an unknown word using greedy matching."""
+        """Tokenize an unknown word, reusing the result for repeated words."""
+        return list(self._word_cache(word))
+    
+    def _match_word(self, word: str) -> Tuple[int, ...]:
+        """Tokenize a word using greedy longest matching over the trie."""
+        root = self._trie
+        unk_id = self.special_tokens["<unk>"]
         tokens = []
-        start = 0
+        node = root
         
-        while start < len(word):
-            end = len(word)
-            found = False
-            
-            while end > start:
-                substr = word[start:end]
-                if substr in self.vocab:
-                    tokens.append(self.vocab[substr])
-                    found = True
+        for char in word:
+            while char not in node.children:
+                if node is root:
+                    # No token starts with this character
+                    tokens.append(unk_id)
                     break
-                end -= 1
-            
-            if not found:
-                # Use unknown token
-                tokens.append(self.special_tokens["<unk>"])
-                start += 1
+                tokens.extend(node.failure_pops)
+                node = node.failure
             else:
-                start = end
+                node = node.children[char]
         
-        return tokens
+        # Flush the pending match
+        while node is not root:
+            tokens.extend(node.failure_pops)
+            node = node.failure
+        
+        return tuple(tokens)
     
     def decode(self, token_ids: List[int]) -> str:
         """
@@ -169,16 +506,17 @@ class SimpleTokenizer:
         Returns:
             Decoded text
         """
-        tokens = []
-        for token_id in token_ids:
-            if token_id in self.reverse_vocab:
-                tokens.append(self.reverse_vocab[token_id])
-            else:
-                tokens.append(self.reverse_vocab[self.special_tokens["<unk>"]])
-        
-        return "".join(tokens)
+        return self.reverse_vocab.decode(token_ids, self.special_tokens["<unk>"])
     
-    def encode_batch(self, texts: List[str], padding: bool = True, truncation: bool = True, max_length: Optional[int] = None) -> Dict[str, List[List[int]]]:
+    def encode_batch(
+        self,
+        texts: List[str],
+        padding: bool = True,
+        truncation: bool = True,
+        max_length: Optional[int] = None,
+        return_numpy: bool = False,
+        num_workers: int = 0
+    ) -> Dict[str, Union[List[List[int]], np.ndarray]]:
         """
         Encode a batch of texts.
         
@@ -187,33 +525,16 @@ class SimpleTokenizer:
             padding: Whether to pad sequences
             truncation: Whether to truncate sequences
             max_length: Maximum sequence length
+            return_numpy: Whether to return padded int64 arrays (usable with
+                torch.from_numpy without a copy) instead of lists
+            num_workers: Number of processes to encode with (0 encodes in
+                this process; worth it only for large batches)
             
         Returns:
             Dictionary with 'input_ids' and 'attention_mask'
         """
-        encoded = [self.encode(text) for text in texts]
-        
-        if max_length is None:
-            max_length = max(len(seq) for seq in encoded) if encoded else 0
-        
-        if truncation:
-            encoded = [seq[:max_length] for seq in encoded]
-        
-        if padding:
-            max_len = max(len(seq) for seq in encoded) if encoded else 0
-            attention_mask = []
-            
-            for i, seq in enumerate(encoded):
-                if len(seq) < max_len:
-                    encoded[i] = seq + [self.special_tokens["<pad>"]] * (max_len - len(seq))
-                attention_mask.append([1] * len(seq) + [0] * (max_len - len(seq)))
-        else:
-            attention_mask = [[1] * len(seq) for seq in encoded]
-        
-        return {
-            "input_ids": encoded,
-            "attention_mask": attention_mask
-        }
+        encoded = _encode_texts(self, texts, num_workers)
+        return _pad_batch(encoded, self.special_tokens["<pad>"], padding, truncation, max_length, return_numpy)
     
     def save(self, path: str):
         """Save the tokenizer to a file."""
@@ -226,8 +547,7 @@ class SimpleTokenizer:
             "min_freq": self.min_freq
         }
         
-        with open(os.path.join(path, "tokenizer.json"), "w") as f:
-            json.dump(tokenizer_data, f, indent=2)
+        save_json(tokenizer_data, os.path.join(path, "tokenizer.json"))
         
         logger.info(f"Tokenizer saved to {path}")
     
@@ -239,8 +559,7 @@ class SimpleTokenizer:
         if not os.path.exists(tokenizer_path):
             raise ValueError(f"Tokenizer file not found at {tokenizer_path}")
         
-        with open(tokenizer_path, "r") as f:
-            tokenizer_data = json.load(f)
+        tokenizer_data = load_json(tokenizer_path)
         
         tokenizer = cls(
             vocab_size=tokenizer_data["vocab_size"],
@@ -248,8 +567,109 @@ class SimpleTokenizer:
             special_tokens=tokenizer_data["special_tokens"]
         )
         
-        tokenizer.vocab = tokenizer_data["vocab"]
-        tokenizer.reverse_vocab = {int(k): v for k, v in tokenizer.vocab.items()}
+        tokenizer.vocab = {_intern_token(token): idx for token, idx in tokenizer_data["vocab"].items()}
+        tokenizer._build_lookups()
+        
+        logger.info(f"Tokenizer loaded from {path}")
+        return tokenizer
+    
+    def save_bin(self, path: str):
+        """
+        Save the tokenizer in the binary format read by load_bin.
+        
+        The file holds a small JSON header, then the CompactVocab arrays
+        (offsets, assigned-ID flags, pair flags) and the token bytes, so
+        loading maps them instead of parsing a JSON vocabulary. Unlike
+        tokenizer.json, pair entries are preserved.
+        
+        Args:
+            path: Directory to write tokenizer.bin into
+        """
+        os.makedirs(path, exist_ok=True)
+        
+        reverse_vocab = CompactVocab(self.vocab)
+        size = len(reverse_vocab.known)
+        pairs = np.zeros(size, dtype=np.uint8)
+        for token, token_id in self.vocab.items():
+            if isinstance(token, tuple):
+                pairs[token_id] = 1
+        
+        header = json.dumps({
+            "special_tokens": self.special_tokens,
+            "vocab_size": self.vocab_size,
+            "min_freq": self.min_freq,
+            "size": size,
+            "buffer_size": len(reverse_vocab.buffer)
+        }).encode("utf-8")
+        
+        # Pad the header so the uint32 offsets that follow stay aligned
+        header += b" " * (-len(header) % 4)
+        
+        with open(os.path.join(path, "tokenizer.bin"), "wb") as f:
+            f.write(struct.pack("<4sI", BINARY_MAGIC, len(header)))
+            f.write(header)
+            f.write(reverse_vocab.offsets.astype("<u4").tobytes())
+            f.write(reverse_vocab.known.astype(np.uint8).tobytes())
+            f.write(pairs.tobytes())
+            f.write(reverse_vocab.buffer)
+        
+        logger.info(f"Tokenizer saved to {path}")
+    
+    @classmethod
+    def load_bin(cls, path: str):
+        """
+        Load a tokenizer saved with save_bin.
+        
+        The ID-to-token table is used in place as views of the
+        memory-mapped file; only the token-to-ID dict is built in memory.
+        
+        Args:
+            path: Directory containing tokenizer.bin
+            
+        Returns:
+            Loaded tokenizer
+        """
+        tokenizer_path = os.path.join(path, "tokenizer.bin")
+        
+        if not os.path.exists(tokenizer_path):
+            raise ValueError(f"Tokenizer file not found at {tokenizer_path}")
+        
+        with open(tokenizer_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, header_size = struct.unpack_from("<4sI", mapped, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"Not a binary tokenizer file: {tokenizer_path}")
+        
+        position = struct.calcsize("<4sI")
+        header = json.loads(mapped[position:position + header_size])
+        position += header_size
+        
+        size = header["size"]
+        offsets = np.frombuffer(mapped, dtype="<u4", count=size + 1, offset=position)
+        position += offsets.nbytes
+        known = np.frombuffer(mapped, dtype=np.bool_, count=size, offset=position)
+        position += size
+        pairs = np.frombuffer(mapped, dtype=np.uint8, count=size, offset=position)
+        position += size
+        buffer = memoryview(mapped)[position:position + header["buffer_size"]]
+        
+        tokenizer = cls(
+            vocab_size=header["vocab_size"],
+            min_freq=header["min_freq"],
+            special_tokens=header["special_tokens"]
+        )
+        
+        # Rebuild the token-to-ID dict in one pass over the token bytes
+        vocab = {}
+        starts = offsets.tolist()
+        is_pair = pairs.tolist()
+        for token_id in np.flatnonzero(known).tolist():
+            token = bytes(buffer[starts[token_id]:starts[token_id + 1]]).decode("utf-8", "surrogatepass")
+            vocab[_intern_token(tuple(token) if is_pair[token_id] else token)] = token_id
+        
+        tokenizer.vocab = vocab
+        tokenizer._build_lookups(CompactVocab.from_arrays(buffer, offsets, known))
         
         logger.info(f"Tokenizer loaded from {path}")
         return tokenizer
@@ -268,63 +688,43 @@ class GPT2Tokenizer:
         
         # Initialize with basic vocabulary
         self.vocab = {}
-        self.reverse_vocab = {}
         
         # Add byte-level tokens
         for i in range(256):
             self.vocab[bytes([i]).decode('latin-1')] = i
-            self.reverse_vocab[i] = bytes([i]).decode('latin-1')
         
         # Add special tokens
         for token, idx in self.special_tokens.items():
             if idx < vocab_size:
                 self.vocab[token] = idx
-                self.reverse_vocab[idx] = token
+        
+        self.reverse_vocab = CompactVocab(self.vocab)
     
     def encode(self, text: str) -> List[int]:
         """Encode text using byte-pair encoding."""
-        # Simple byte-level encoding for now
-        tokens = []
-        for char in text:
-            if char in self.vocab:
-                tokens.append(self.vocab[char])
-            else:
-                # Fallback to unknown token
-                tokens.append(self.special_tokens.get("<|pad|>", 0))
-        
-        return tokens
+        # Simple byte-level encoding for now: characters U+0000-U+00FF are
+        # their own IDs, so one vectorized pass over the code points replaces
+        # a vocab lookup per character
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        
+        # Fallback to unknown token
+        unk_id = self.special_tokens.get("<|pad|>", 0)
+        return np.where(codes < 256, codes, unk_id).tolist()
     
     def decode(self, token_ids: List[int]) -> str:
         """Decode token IDs back to text."""
-        text = ""
-        for token_id in token_ids:
-            if token_id in self.reverse_vocab:
-                text += self.reverse_vocab[token_id]
-        
-        return text
+        # Unknown IDs are skipped
+        return self.reverse_vocab.decode(token_ids)
     
-    def encode_batch(self, texts: List[str], padding: bool = True, truncation: bool = True, max_length: Optional[int] = None) -> Dict[str, List[List[int]]]:
+    def encode_batch(
+        self,
+        texts: List[str],
+        padding: bool = True,
+        truncation: bool = True,
+        max_length: Optional[int] = None,
+        return_numpy: bool = False,
+        num_workers: int = 0
+    ) -> Dict[str, Union[List[List[int]], np.ndarray]]:
         """Encode a batch of texts."""
-        encoded = [self.encode(text) for text in texts]
-        
-        if max_length is None:
-            max_length = max(len(seq) for seq in encoded) if encoded else 0
-        
-        if truncation:
-            encoded = [seq[:max_length] for seq in encoded]
-        
-        if padding:
-            max_len = max(len(seq) for seq in encoded) if encoded else 0
-            attention_mask = []
-            
-            for i, seq in enumerate(encoded):
-                if len(seq) < max_len:
-                    encoded[i] = seq + [self.special_tokens["<|pad|>"]] * (max_len - len(seq))
-                attention_mask.append([1] * len(seq) + [0] * (max_len - len(seq)))
-        else:
-            attention_mask = [[1] * len(seq) for seq in encoded]
-        
-        return {
-            "input_ids": encoded,
-            "attention_mask": attention_mask
-        }
\ No newline at end of file
+        encoded = _encode_texts(self, texts, num_workers)
+        return _pad_batch(encoded, self.special_tokens["<|pad|>"], padding, truncation, max_length, return_numpy)
\ No newline at end of file
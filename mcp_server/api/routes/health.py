@@ -4,13 +4,17 @@ Health Check API Routes
 API endpoints for health monitoring and system status.
 """
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from pydantic import BaseModel
 from typing import Dict, Any, List
+import asyncio
 import logging
 import psutil
 import time
 from datetime import datetime
+from sqlalchemy import text
 
 from ...core.config import get_settings
 from ...core.database import DatabaseManager
@@ -44,6 +48,13 @@ class DetailedHealthResponse(BaseModel):
 # Global variables for tracking
 start_time = time.time()
 
+# System readings are shared by all requests within this many seconds
+SYSTEM_INFO_TTL_SECONDS = 1.0
+_system_info_cache = {"value": None, "timestamp": 0.0}
+
+# Prime the CPU counter so later non-blocking reads measure since the previous read
+psutil.cpu_percent(interval=None)
+
 def get_uptime() -> float:
     """Get server uptime in seconds."""
     return time.time() - start_time
@@ -55,7 +66,7 @@ def check_database_health() -> str:
         if settings.database_url:
             db_manager = DatabaseManager(settings.database_url)
             session = db_manager.get_session()
-            session.execute("SELECT 1")
+            session.execute(text("SELECT 1"))
             db_manager.close_session(session)
             return "healthy"
         else:
@@ -67,8 +78,8 @@ def check_database_health() -> str:
 def get_system_info() -> SystemInfo:
     """Get system resource information."""
     try:
-        # CPU usage
-        cpu_usage = psutil.cpu_percent(interval=1)
+        # CPU usage since the previous reading (non-blocking)
+        cpu_usage = psutil.cpu_percent(interval=None)
         
         # Memory usage
         memory = psutil.virtual_memory()
@@ -102,6 +113,50 @@ def get_system_info() -> SystemInfo:
             network_io={"bytes_sent": 0, "bytes_recv": 0, "packets_sent": 0, "packets_recv": 0}
         )
 
+async def check_database_health_async() -> str:
+    """Check database health in the default executor so the query does not block the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, check_database_health)
+
+async def get_system_info_cached() -> SystemInfo:
+    """Get system resource information, refreshed at most once per TTL."""
+    now = time.monotonic()
+    if _system_info_cache["value"] is not None and now - _system_info_cache["timestamp"] < SYSTEM_INFO_TTL_SECONDS:
+        return _system_info_cache["value"]
+    
+    # psutil reads /proc and disk stats; keep them off the event loop
+    loop = asyncio.get_running_loop()
+    system_info = await loop.run_in_executor(None, get_system_info)
+    
+    _system_info_cache["value"] = system_info
+    _system_info_cache["timestamp"] = time.monotonic()
+    return system_info
+
+class SystemMetricsCollector:
+    """Prometheus collector exposing the cached system readings."""
+    
+    def collect(self):
+        yield GaugeMetricFamily("mcp_server_uptime_seconds", "Server uptime in seconds", value=get_uptime())
+        
+        system_info = _system_info_cache["value"]
+        if system_info is None:
+            return
+        
+        yield GaugeMetricFamily("mcp_server_cpu_usage_percent", "CPU usage percentage", value=system_info.cpu_usage)
+        yield GaugeMetricFamily("mcp_server_memory_usage_percent", "Memory usage percentage", value=system_info.memory_usage)
+        yield GaugeMetricFamily("mcp_server_disk_usage_percent", "Disk usage percentage", value=system_info.disk_usage)
+        
+        for name, description in [
+            ("bytes_sent", "Network bytes sent"),
+            ("bytes_recv", "Network bytes received"),
+            ("packets_sent", "Network packets sent"),
+            ("packets_recv", "Network packets received")
+        ]:
+            yield CounterMetricFamily(f"mcp_server_network_{name}", description, value=system_info.network_io[name])
+
+METRICS_REGISTRY = CollectorRegistry()
+METRICS_REGISTRY.register(SystemMetricsCollector())
+
 @router.get("/", response_model=HealthResponse)
 async def health_check():
     """
@@ -116,7 +171,7 @@ async def health_check():
         # Check services
         services = {
             "api": "healthy",
-            "database": check_database_health()
+            "database": await check_database_health_async()
         }
         
         # Determine overall status
@@ -156,11 +211,11 @@ async def detailed_health_check():
         # Check services
         services = {
             "api": "healthy",
-            "database": check_database_health()
+            "database": await check_database_health_async()
         }
         
         # Get system information
-        system_info = get_system_info()
+        system_info = await get_system_info_cached()
         
         # Determine overall status
         overall_status = "healthy"
@@ -208,7 +263,7 @@ async def readiness_check():
     """
     try:
         # Check if all critical services are ready
-        database_status = check_database_health()
+        database_status = await check_database_health_async()
         
         if database_status == "healthy":
             return {"status": "ready", "timestamp": datetime.utcnow()}
@@ -244,47 +299,14 @@ async def metrics():
         System metrics in Prometheus format
     """
     try:
-        system_info = get_system_info()
-        uptime = get_uptime()
-        
-        metrics = f"""# HELP mcp_server_uptime_seconds Server uptime in seconds
-# TYPE mcp_server_uptime_seconds gauge
-mcp_server_uptime_seconds {uptime}
-
-# HELP mcp_server_cpu_usage_percent CPU usage percentage
-# TYPE mcp_server_cpu_usage_percent gauge
-mcp_server_cpu_usage_percent {system_info.cpu_usage}
-
-# HELP mcp_server_memory_usage_percent Memory usage percentage
-# TYPE mcp_server_memory_usage_percent gauge
-mcp_server_memory_usage_percent {system_info.memory_usage}
-
-# HELP mcp_server_disk_usage_percent Disk usage percentage
-# TYPE mcp_server_disk_usage_percent gauge
-mcp_server_disk_usage_percent {system_info.disk_usage}
-
-# HELP mcp_server_network_bytes_sent Network bytes sent
-# TYPE mcp_server_network_bytes_sent counter
-mcp_server_network_bytes_sent {system_info.network_io['bytes_sent']}
-
-# HELP mcp_server_network_bytes_recv Network bytes received
-# TYPE mcp_server_network_bytes_recv counter
-mcp_server_network_bytes_recv {system_info.network_io['bytes_recv']}
-
-# HELP mcp_server_network_packets_sent Network packets sent
-# TYPE mcp_server_network_packets_sent counter
-mcp_server_network_packets_sent {system_info.network_io['packets_sent']}
-
-# HELP mcp_server_network_packets_recv Network packets received
-# TYPE mcp_server_network_packets_recv counter
-mcp_server_network_packets_recv {system_info.network_io['packets_recv']}
-"""
+        await get_system_info_cached()
         
-        return metrics
+        # The collector reads the refreshed cache entry
+        return Response(generate_latest(METRICS_REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
         
     except Exception as e:
         logger.error(f"Metrics collection failed: {str(e)}")
-        return "# Error collecting metrics"
+        return Response("# Error collecting metrics\n", status_code=500, headers={"Content-Type": CONTENT_TYPE_LATEST})
 
 @router.get("/info")
 async def system_info():
@@ -295,7 +317,7 @@ async def system_info():
         Detailed system information
     """
     try:
-        system_info = get_system_info()
+        system_info = await get_system_info_cached()
         
         # Get additional system information
         additional_info = {
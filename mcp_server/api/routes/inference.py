@@ -5,12 +5,16 @@ API endpoints for model inference and predictions.
 """
 
 from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any, Union
+from functools import lru_cache
 import logging
 import time
 import uuid
 from datetime import datetime
+import orjson
 
 from ...core.database import InferenceLogManager, DatabaseManager
 from ...core.config import get_settings
@@ -57,7 +61,7 @@ class InferenceResponse(BaseModel):
     request_id: str
     model_id: str
     task_type: str
-    result: Union[str, Dict[str, Any], List[Dict[str, Any]]]
+    result: Union[str, List[str], Dict[str, Any], List[Dict[str, Any]]]
     processing_time_ms: int
     timestamp: datetime
 
@@ -70,8 +74,14 @@ class BatchInferenceResponse(BaseModel):
     timestamp: datetime
 
 # Dependency injection
+@lru_cache()
 def get_inference_service():
-    """Get inference service instance."""
+    """
+    Get the process-wide inference service instance.
+    
+    Sharing one instance keeps loaded models, and their batch schedulers,
+    across requests so concurrent requests can be coalesced.
+    """
     settings = get_settings()
     db_manager = DatabaseManager(settings.database_url or "sqlite:///./mcp_server.db")
     inference_log = InferenceLogManager(db_manager)
@@ -144,6 +154,67 @@ async def generate_text(
             detail=f"Text generation failed: {str(e)}"
         )
 
+@router.post("/generate_stream")
+async def generate_text_stream(
+    request: TextGenerationRequest,
+    model_id: Optional[str] = None,
+    inference_service: InferenceService = Depends(get_inference_service)
+):
+    """
+    Stream generated text as server-sent events.
+    
+    Each event carries one decoded token as ``{"token": ...}``; the stream
+    ends with a ``[DONE]`` event.
+    
+    Args:
+        request: Text generation request
+        model_id: Model identifier (uses default if not specified)
+        inference_service: Inference service instance
+        
+    Returns:
+        Streaming response of generated tokens
+    """
+    start_time = time.time()
+    request_id = str(uuid.uuid4())
+    tokens = []
+    
+    async def event_stream():
+        try:
+            async for token in inference_service.stream_text(
+                prompt=request.prompt,
+                model_id=model_id,
+                max_length=request.max_length,
+                min_length=request.min_length,
+                temperature=request.temperature,
+                top_p=request.top_p,
+                top_k=request.top_k,
+                do_sample=request.do_sample,
+                repetition_penalty=request.repetition_penalty
+            ):
+                tokens.append(token)
+                yield f"data: {orjson.dumps({'token': token}).decode()}\n\n"
+        except Exception as e:
+            logger.error(f"Error in streaming text generation: {str(e)}")
+            yield f"event: error\ndata: {orjson.dumps({'detail': str(e)}).decode()}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    def log_stream():
+        inference_service.log_inference(
+            model_id=model_id or "default",
+            task_type="generate_stream",
+            input_data=request.prompt,
+            output_data="".join(tokens),
+            processing_time_ms=int((time.time() - start_time) * 1000),
+            request_id=request_id
+        )
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Request-ID": request_id},
+        background=BackgroundTask(log_stream)
+    )
+
 @router.post("/classify", response_model=InferenceResponse)
 async def classify_text(
     request: TextClassificationRequest,
@@ -4,7 +4,7 @@ Inference Service
 Business logic for model inference operations.
 """
 
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, AsyncIterator
 import logging
 import asyncio
 from datetime import datetime
@@ -13,7 +13,7 @@ from ..core.database import InferenceLogManager
 from ..core.config import get_settings
 from llm.models.transformer_model import TransformerModel
 from llm.models.text_classifier import TextClassifier
-from llm.models.text_generator import TextGenerator
+from llm.models.text_generator import TextGenerator, GenSpec
 
 logger = logging.getLogger(__name__)
 
@@ -95,23 +95,32 @@ class InferenceService:
         """Generate text using a language model."""
         try:
             model = self._get_model(model_id, "text-generation")
+            config = GenSpec(
+                max_length=max_length,
+                min_length=min_length,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                do_sample=do_sample,
+                num_return_sequences=num_return_sequences,
+                repetition_penalty=repetition_penalty
+            )
             
-            # Run generation in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            generated_text = await loop.run_in_executor(
-                None,
-                lambda: model.generate(
-                    prompt=prompt,
-                    max_length=max_length,
-                    min_length=min_length,
-                    temperature=temperature,
-                    top_p=top_p,
-                    top_k=top_k,
-                    do_sample=do_sample,
-                    num_return_sequences=num_return_sequences,
-                    repetition_penalty=repetition_penalty
+            if num_return_sequences == 1:
+                # Concurrent requests with the same parameters share one batched
+                # generate call (run in the thread pool by the scheduler)
+                generated_text = await model.generate_async(prompt, config)
+            else:
+                # Run generation in thread pool to avoid blocking
+                loop = asyncio.get_event_loop()
+                generated_text = await loop.run_in_executor(
+                    None,
+                    lambda: model.generate_multiple(
+                        prompt,
+                        num_sequences=num_return_sequences,
+                        config=config
+                    )
                 )
-            )
             
             return {
                 "generated_text": generated_text,
@@ -133,6 +142,41 @@ class InferenceService:
             logger.error(f"Error in text generation: {str(e)}")
             raise
     
+    async def stream_text(
+        self,
+        prompt: str,
+        model_id: Optional[str] = None,
+        max_length: int = 100,
+        min_length: int = 10,
+        temperature: float = 0.7,
+        top_p: float = 0.9,
+        top_k: int = 50,
+        do_sample: bool = True,
+        repetition_penalty: float = 1.0
+    ) -> AsyncIterator[str]:
+        """Generate text token by token using a language model."""
+        model = self._get_model(model_id, "text-generation")
+        config = GenSpec(
+            max_length=max_length,
+            min_length=min_length,
+            temperature=temperature,
+            top_p=top_p,
+            top_k=top_k,
+            do_sample=do_sample,
+            repetition_penalty=repetition_penalty
+        )
+        
+        # Pull each token in the thread pool so decoding never blocks the loop
+        loop = asyncio.get_event_loop()
+        tokens = model.stream_generate(prompt, config)
+        done = object()
+        
+        while True:
+            token = await loop.run_in_executor(None, next, tokens, done)
+            if token is done:
+                break
+            yield token
+    
     async def classify_text(
         self,
         text: str,
@@ -158,10 +202,8 @@ class InferenceService:
                     lambda: model.get_top_k_predictions(text, k=top_k)
                 )
             else:
-                result = await loop.run_in_executor(
-                    None,
-                    lambda: model.classify(text)
-                )
+                # Concurrent single-label requests share one batched forward pass
+                result = await model.classify_async(text)
             
             return {
                 "classification": result,
@@ -257,13 +299,12 @@ class InferenceService:
             loop = asyncio.get_event_loop()
             
             if task_type == "text-generation":
-                results = []
-                for text in texts:
-                    result = await loop.run_in_executor(
-                        None,
-                        lambda t=text: model.generate(t, **parameters)
-                    )
-                    results.append(result)
+                # One batched generate call instead of one call per text
+                config = GenSpec(**parameters)
+                results = await loop.run_in_executor(
+                    None,
+                    lambda: model.generate_batch(texts, config)
+                )
                     
             elif task_type == "classification":
                 results = await loop.run_in_executor(
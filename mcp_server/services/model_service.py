@@ -218,9 +218,16 @@ class ModelService:
             
             # Check if it's a directory (for local models)
             if os.path.isdir(model_path):
-                # Check for common model files
-                required_files = ["config.json", "pytorch_model.bin"]
-                return all(os.path.exists(os.path.join(model_path, f)) for f in required_files)
+                # Check for the config and either weights format, single file or sharded
+                weight_files = [
+                    "model.safetensors",
+                    "model.safetensors.index.json",
+                    "pytorch_model.bin",
+                    "pytorch_model.bin.index.json"
+                ]
+                return os.path.exists(os.path.join(model_path, "config.json")) and any(
+                    os.path.exists(os.path.join(model_path, f)) for f in weight_files
+                )
             
             return True
             